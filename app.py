@@ -1,20 +1,25 @@
 # Run this app with `python app.py` and
 # visit http://127.0.0.1:8050/ in your web browser.
 
+import logging
 import os
+import time
 from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 
 import dash_bootstrap_components as dbc
 import orjson
-import plotly.io as pio
 from dash import CeleryManager, Dash, DiskcacheManager, dcc, html
 from dash.dependencies import Input, Output, State
 from dash.exceptions import PreventUpdate
-from flask_caching import Cache
+from flask import g, request
 
-from backend import create, extract, utils
+# backend.create, .export and .extract pull in pandas, numpy, lxml and
+# plotly, they are imported by the callbacks that need them
+from backend import cache, metrics, session, store, utils
+from backend.progress import ProgressReporter
 from frontend.download import download_content
 from frontend.info import info_content
+from frontend.results import results_content
 from frontend.warn import warn_content
 
 if 'REDIS_URL' in os.environ:
@@ -25,11 +30,26 @@ if 'REDIS_URL' in os.environ:
                         backend=os.environ['REDIS_URL'])
     background_callback_manager = CeleryManager(celery_app)
 
+    from celery.signals import worker_init
+
+    @worker_init.connect
+    def preload_worker(**kwargs):
+        # before the pool processes are forked, the render server outlives
+        # the pool processes that run the jobs
+        preload()
+        from backend import renderer
+        renderer.start_server()
+
 else:
     # Diskcache for non-production apps when developing locally
     import diskcache
-    cache = diskcache.Cache("./cache")
-    background_callback_manager = DiskcacheManager(cache)
+    background_callback_manager = DiskcacheManager(diskcache.Cache("./cache"))
+
+def preload():
+    """imports the modules the callbacks load lazily, so that processes
+    forked afterwards share them (see gunicorn.conf.py)"""
+    from backend import batch, calltable, create, export, extract  # noqa: F401
+
 
 app = Dash(__name__,
            title="skype waddle",
@@ -38,12 +58,88 @@ app = Dash(__name__,
            background_callback_manager=background_callback_manager)
 
 server = app.server
-cache = Cache(server, config={
-    'CACHE_TYPE': 'redis',
-    'CACHE_REDIS_URL': os.environ.get('REDIS_URL', '')
-    # 'CACHE_TYPE': 'FileSystemCache',
-    # 'CACHE_DIR': 'cache-directory',
-})
+
+# one json line per callback request, see backend.metrics
+logging.basicConfig(format='%(asctime)s %(name)s %(levelname)s %(message)s')
+logging.getLogger(metrics.__name__).setLevel(logging.INFO)
+
+
+@server.route('/cache-stats')
+def cache_stats():
+    return server.response_class(orjson.dumps(cache.stats()),
+                                 mimetype='application/json')
+
+
+@server.route('/callback-metrics')
+def callback_metrics():
+    return server.response_class(orjson.dumps(metrics.stats()),
+                                 mimetype='application/json')
+
+
+@server.before_request
+def start_timer():
+    g.request_start = time.perf_counter()
+
+
+@server.after_request
+def record_callback(response):
+    if request.path.endswith('/_dash-update-component'):
+        body = request.get_json(silent=True) or {}
+        entry = metrics.record(body.get('output', ''),
+                               request.content_length or 0,
+                               response.calculate_content_length() or 0,
+                               time.perf_counter() - g.request_start)
+        # tests fail on callbacks moving too much data
+        metrics.check_budget(entry, strict=server.testing)
+    return response
+
+
+@server.route('/figure/<session_key>/<plot_id>')
+def figure(session_key, plot_id):
+    # one figure of the results view, see assets/figures.js
+    plot = session.load_figure_json(session_key, plot_id)
+    if plot is None:
+        return server.response_class(orjson.dumps({'error': 'expired'}),
+                                     status=404, mimetype='application/json')
+    response = server.response_class(plot, mimetype='application/json')
+    # the figures of a session never change
+    response.cache_control.private = True
+    response.cache_control.max_age = session.SESSION_TIMEOUT
+    return response
+
+
+@server.route('/upload', methods=['POST'])
+def upload():
+    # the export is streamed to disk, callbacks only pass the returned token
+    try:
+        token = utils.save_upload(request.stream,
+                                  request.args.get('filename', ''))
+    except ValueError as error:
+        return server.response_class(orjson.dumps({'error': str(error)}),
+                                     status=400, mimetype='application/json')
+    return server.response_class(orjson.dumps({'token': token}),
+                                 mimetype='application/json')
+
+
+app.clientside_callback(
+    """
+    function(n_clicks) {
+        // set by assets/upload.js once the upload finished
+        const upload = window.skypewaddleUpload;
+        if (!upload) {
+            return [window.dash_clientside.no_update, null];
+        }
+        if (upload.error) {
+            return [window.dash_clientside.no_update, upload.error];
+        }
+        return [upload, null];
+    }
+    """,
+    Output('upload-handle', 'data'),
+    Output('upload-error', 'children'),
+    Input('upload-done', 'n_clicks'),
+    prevent_initial_call=True,
+)
 
 app.clientside_callback(
     """
@@ -74,8 +170,12 @@ app.layout = html.Div(children=[
     dcc.Store(id='data', storage_type='memory'),
     dcc.Store(id='data2', storage_type='memory'),
     dcc.Store(id='open-warn', storage_type='memory'),
-    dcc.Store(id='plots', storage_type='local'),
+    # the figures are kept on the server, see backend.session
+    dcc.Store(id='session', storage_type='local'),
     dcc.Store(id='participant_userid', storage_type='memory'),
+    dcc.Store(id='upload-handle', storage_type='memory'),
+    dcc.Store(id='export-key', storage_type='memory'),
+    dcc.Store(id='previous-export-key', storage_type='local'),
     # url for relaunching app
     dcc.Location(id='url', refresh=True),
 
@@ -106,13 +206,19 @@ app.layout = html.Div(children=[
                 id='data-step',
                 children=[
                     html.H3(children='Upload your data to get started 🚀'),
-                    dcc.Upload(id='upload-data',
-                                max_size=100000000,
-                                children=html.Div([
-                                    'Drag and Drop or ',
-                                    html.A('Select Files')
-                                ], className='upload-text'),
-                                className="upload")
+                    # the file is sent to /upload by assets/upload.js
+                    html.Div(id='upload-data',
+                             children=[
+                                 html.Div([
+                                     'Drag and Drop or ',
+                                     html.A('Select Files')
+                                 ], className='upload-text'),
+                                 html.Div(id='upload-error',
+                                          className='upload-text'),
+                             ],
+                             className="upload"),
+                    html.Button(id='upload-done', n_clicks=0,
+                                style={'display': 'none'})
                 ],
                 style={'display': 'none'}),
             html.Div(
@@ -143,7 +249,7 @@ app.layout = html.Div(children=[
                          class_name='progress',
                          style={'display': 'none'}),
         ],style={'display': 'none'}),
-        dbc.Row(id='graph-row', style={'display': 'none'}),
+        dbc.Row(id='graph-row', children=results_content, style={'display': 'none'}),
         dbc.Row(id='download-step', children=download_content, style={'display': 'none'}),
     ],
     style={
@@ -163,14 +269,13 @@ app.layout = html.Div(children=[
               Output('progress-bar', 'style'),
               Output('graph-row', 'style'),
               Output('download-step', 'style'),
-              Input('upload-data', 'contents'),
+              Input('upload-handle', 'data'),
               Input('participant_DD','value'),
               Input('submit-participant', 'n_clicks'),
-              Input('graph-row', 'children'),
-              Input('plots', 'data'),
+              Input('session', 'data'),
 )
 def render_site_content(uploaded_data, participant_value, participant_confirmed,
-                        graph_figure, plots_storage):
+                        session_key):
     show = {'display': 'block'}
     hide = {'display': 'none'}
 
@@ -187,48 +292,42 @@ def render_site_content(uploaded_data, participant_value, participant_confirmed,
         'download-step': hide,
     }
 
-    if graph_figure is None and plots_storage is None:
+    if session_key is None:
         out['waddle-big-logo'] = show
         out['tagline'] = show
         out['user-input-step'] = show
 
-    if uploaded_data is None and plots_storage is None:
+    if uploaded_data is None and session_key is None:
         out['data-step'] = show
 
     if (uploaded_data is not None and
         participant_confirmed == 0 and
-        plots_storage is None):
+        session_key is None):
         out['select-participant'] = show
 
     if (uploaded_data is not None and
         participant_value is not None and
         participant_confirmed == 0 and
-        plots_storage is None):
+        session_key is None):
         out['confirm-select'] = show
 
     if (participant_confirmed and
-        graph_figure is None and
-        plots_storage is None):
+        session_key is None):
         out['progress-bar'] = show
 
-    if (graph_figure is not None or
-        plots_storage is not None):
+    if session_key is not None:
         out['graph-row'] = show
 
-    if (graph_figure is not None or
-        plots_storage is not None):
+    if session_key is not None:
         out['waddle-big-logo'] = hide
 
-    if (graph_figure is not None or
-        plots_storage is not None):
+    if session_key is not None:
         out['waddle-small-logo'] = show
 
-    if (graph_figure is not None or
-        plots_storage is not None):
+    if session_key is not None:
         out['tagline'] = hide
 
-    if (graph_figure is not None or
-        plots_storage is not None):
+    if session_key is not None:
         out['download-step'] = show
 
     return [out[k] for k in out]
@@ -236,23 +335,27 @@ def render_site_content(uploaded_data, participant_value, participant_confirmed,
 
 @app.callback(Output('participant_DD', 'options'),
               Output('participant_userid', 'data'),
-              Input('upload-data', 'contents'),
-              State('upload-data', 'filename'))
-def on_upload(contents, filename):
-    if contents is not None:
-        conversations = get_conversations(contents, filename)
-        participants = extract.extract_conversations(conversations)
+              Output('export-key', 'data'),
+              Input('upload-handle', 'data'))
+def on_upload(upload_handle):
+    if upload_handle is not None:
+        # the token is the content hash of the export, everything derived
+        # from the export is keyed by it
+        export_key = upload_handle['token']
+        if not cache.fetch_export(export_key):
+            raise PreventUpdate
+        conversations = store.read_conversation_headers(export_key)
+        participants = store.extract_conversations(conversations)
+        # all conversations at once, see backend.batch
+        participants.append({'label': 'Everyone',
+                             'username': store.EVERYONE})
         options = [{
             'label': p['label'],
             'value': idx
         } for idx, p in enumerate(participants)]
-        return options, participants
+        return options, participants, export_key
     raise PreventUpdate
 
-@cache.memoize(timeout=300)
-def get_conversations(contents, filename):
-    return utils.read_conversations_from_file(contents, filename)
-
 @app.callback(
     Output("info-modal", "is_open"),
     Input("info-open", "n_clicks"),
@@ -276,17 +379,16 @@ def toggle_warn_modal(open_warn, is_open):
 
 
 @app.callback(
-    Output('graph-row', 'children'),
-    Output('plots', 'data'),
+    Output('session', 'data'),
+    Output('previous-export-key', 'data'),
     Output('open-warn', 'data'),
     Output('submit-participant', 'disabled'),
     Output('submit-participant', 'children'),
     Input('submit-participant', 'n_clicks'),
-    Input('plots', 'data'),
     State('participant_DD', 'value'),
     State('participant_userid', 'data'),
-    State('upload-data', 'contents'),
-    State('upload-data', 'filename'),
+    State('export-key', 'data'),
+    State('previous-export-key', 'data'),
     State('clientside-timezone', 'data'),
     background=True,
     running=[(
@@ -307,11 +409,12 @@ def toggle_warn_modal(open_warn, is_open):
         Output('submit-participant', 'disabled'),True, False
     )],
     progress=[Output("progress-bar", "value"),
-              Output("progress-bar", "max")],
+              Output("progress-bar", "max"),
+              Output("progress-bar", "label")],
     prevent_initial_call=True)
-def on_participant_select(update_progress, participant_submitted, plots_storage,
-                          participant_value, participant_userid, upload_contents, upload_filename,
-                          timezone):
+def on_participant_select(update_progress, participant_submitted,
+                          participant_value, participant_userid, export_key,
+                          previous_export_key, timezone):
     if timezone is None:
         timezone = {'clientside_timezone': 'UTC'}
     try:
@@ -320,118 +423,139 @@ def on_participant_select(update_progress, participant_submitted, plots_storage,
         timezone['clientside_timezone'] = 'UTC'
 
 
-    if ((participant_value is not None and
-        participant_submitted > 0) or
-        plots_storage is not None):
+    if participant_value is not None and participant_submitted > 0:
         participant = participant_userid[participant_value]
-        if plots_storage is None:
-            try:
-                conversations = get_conversations(upload_contents, upload_filename)
-                df = get_df(update_progress, conversations, participant_value,
-                                    timezone['clientside_timezone'])
-            except ValueError:
-                return None, None, True, True, 'Generating plots... 📈'
-            plots = get_plots(df, participant)
-        else:
-            plots = plots_storage
-        tabs = dbc.Tabs(
-            [
-                dbc.Tab(label="Duration", tab_id="duration-plot", children=utils.make_tab(plots['duration-plot'])),
-                dbc.Tab(label="Weekday", tab_id="weekday-plot", children=utils.make_tab(plots['weekday-plot'])),
-                dbc.Tab(label="Calendar", tab_id="calendar-plot", children=utils.make_tab(plots['calendar-plot'])),
-                dbc.Tab(label="Call starter", tab_id="caller-plot", children=utils.make_tab(plots['caller-plot'])),
-                dbc.Tab(label="Call ender", tab_id="terminator-plot", children=utils.make_tab(plots['terminator-plot'])),
-            ]
-        )
-
-        return tabs, plots, False, True, 'Generating plots... 📈'
+        progress = ProgressReporter(update_progress)
+        try:
+            summary = get_summary(progress, export_key, previous_export_key,
+                                  participant_value, participant,
+                                  timezone['clientside_timezone'])
+        except ValueError:
+            return (None, previous_export_key, True, True,
+                    'Generating plots... 📈')
+        progress.stage('plot')
+        plots = get_plots(summary, export_key, participant,
+                          timezone['clientside_timezone'])
+        figures = {plot_id: orjson.loads(figure.to_json())
+                   for plot_id, figure in plots.items()}
+        # users download right after looking at the plots
+        from backend import export
+        export.prerender(figures)
+        session_key = session.create(figures)
+
+        return session_key, export_key, False, True, 'Generating plots... 📈'
 
     raise PreventUpdate
 
-@cache.memoize(timeout=300)
-def get_df(update_progress, conversations, participant_value,
-                                    timezone):
-    return extract.get_calls(update_progress, conversations, participant_value,
-                                    timezone)
-
-@cache.memoize(timeout=3600)
-def get_plots(df, participant):
-    return {
-                'duration-plot': create.duration_plot(df),
-                'weekday-plot': create.weekday_plot(df),
-                'calendar-plot': create.calendar_plot(df),
-                'caller-plot': create.caller_plot(df, participant),
-                'terminator-plot': create.terminator_plot(df, participant),
-            }
 
-@app.callback(
-    Output('download-duration-plot', 'data'),
-    Input('download-button', 'n_clicks'),
-    State('plots', 'data'),
-    prevent_initial_call=True,
-)
-def download_duration_data(download_click, plots_storage):
-    if download_click > 0:
-        fig = pio.from_json(orjson.dumps(plots_storage['duration-plot']))
-        img_bytes = fig.to_image(format="png", scale=10)
-        img_name = "mywaddle-duration.png"
-        return dcc.send_bytes(img_bytes, img_name)
-    raise PreventUpdate
-
-@app.callback(
-    Output('download-weekday-plot', 'data'),
-    Input('download-button', 'n_clicks'),
-    State('plots', 'data'),
-    prevent_initial_call=True,
-)
-def download_weekday_data(download_click, plots_storage):
-    if download_click > 0:
-        fig = pio.from_json(orjson.dumps(plots_storage['weekday-plot']))
-        img_bytes = fig.to_image(format="png", scale=10)
-        img_name = "mywaddle-weekdays.png"
-        return dcc.send_bytes(img_bytes, img_name)
-    raise PreventUpdate
-
-@app.callback(
-    Output('download-calendar-plot', 'data'),
-    Input('download-button', 'n_clicks'),
-    State('plots', 'data'),
-    prevent_initial_call=True,
+app.clientside_callback(
+    """
+    function(active_tab, session_key, plot_ids) {
+        if (!session_key || !active_tab) {
+            throw window.dash_clientside.PreventUpdate;
+        }
+        return window.skypewaddleFigures.load(session_key, active_tab, plot_ids)
+            .then(figure => figure === null
+                // expired, back to the upload
+                ? [window.dash_clientside.no_update, true]
+                : [figure, window.dash_clientside.no_update]);
+    }
+    """,
+    Output('plot-graph', 'figure'),
+    Output('session', 'clear_data'),
+    Input('plot-tabs', 'active_tab'),
+    Input('session', 'data'),
+    State('plot-ids', 'data'),
 )
-def download_calendar_data(download_click, plots_storage):
-    if download_click > 0:
-        fig = pio.from_json(orjson.dumps(plots_storage['calendar-plot']))
-        img_bytes = fig.to_image(format="png", scale=10)
-        img_name = "mywaddle-year.png"
-        return dcc.send_bytes(img_bytes, img_name)
-    raise PreventUpdate
 
-@app.callback(
-    Output('download-caller-plot', 'data'),
-    Input('download-button', 'n_clicks'),
-    State('plots', 'data'),
-    prevent_initial_call=True,
-)
-def download_caller_data(download_click, plots_storage):
-    if download_click > 0:
-        fig = pio.from_json(orjson.dumps(plots_storage['caller-plot']))
-        img_bytes = fig.to_image(format="png", scale=10)
-        img_name = "mywaddle-caller.png"
-        return dcc.send_bytes(img_bytes, img_name)
-    raise PreventUpdate
+def get_df(progress, export_key, previous_export_key, participant_value,
+           participant, timezone):
+    from backend import extract
+    from backend.calltable import CallTable
+
+    # the call table is extracted once and shown in any timezone
+    partner_id = participant['username']
+    stored = store.load_calls(export_key, partner_id)
+    if stored is not None:
+        return extract.project_calls(stored[0].to_frame(), timezone)
+
+    # only the MessageList of the selected conversation is decoded
+    progress.stage('parse')
+    # the upload may have been received on another machine
+    if not cache.fetch_export(export_key):
+        raise ValueError("The upload is no longer stored.")
+    if partner_id == store.EVERYONE:
+        # every conversation in a process pool of this worker
+        from backend import batch
+        calls = batch.extract_everyone(progress, export_key)
+        store.save_calls(export_key, partner_id, CallTable.from_frame(calls),
+                         None)
+        return extract.project_calls(calls, timezone)
+    messages = store.read_message_list(export_key, participant_value)
+    calls = get_utc_calls(progress, messages, previous_export_key, partner_id)
+    store.save_calls(export_key, partner_id, CallTable.from_frame(calls),
+                     extract.get_watermark(messages))
+    return extract.project_calls(calls, timezone)
+
+def get_utc_calls(progress, messages, previous_export_key, partner_id):
+    from backend import extract
+
+    # a newer export of an analysed one only needs its new messages
+    previous = None
+    if store.is_key(previous_export_key):
+        previous = store.load_calls(previous_export_key, partner_id)
+    if previous is not None and previous[1] is not None:
+        calls = extract.extend_utc_calls(progress, messages,
+                                         previous[0].to_frame(), previous[1])
+        if calls is not None:
+            return calls
+    return extract.extract_utc_calls(progress, messages)
+
+def get_summary(progress, export_key, previous_export_key, participant_value,
+                participant, timezone):
+    from backend import create
+
+    # the plots only need the aggregates, not the calls
+    return cache.get_or_compute(
+        'summary', export_key, participant['username'], timezone,
+        lambda: create.summarize(get_df(progress, export_key,
+                                        previous_export_key,
+                                        participant_value, participant,
+                                        timezone)))
+
+def get_plots(summary, export_key, participant, timezone):
+    return cache.get_or_compute('plots', export_key, participant['username'],
+                                timezone,
+                                lambda: make_plots(summary, participant))
+
+def make_plots(summary, participant):
+    from backend import create
+
+    if participant['username'] == store.EVERYONE:
+        # there is no single friend to point out
+        participant = None
+    return {
+                'duration-plot': create.duration_plot(summary),
+                'weekday-plot': create.weekday_plot(summary),
+                'calendar-plot': create.calendar_plot(summary),
+                'caller-plot': create.caller_plot(summary, participant),
+                'terminator-plot': create.terminator_plot(summary, participant),
+            }
 
 @app.callback(
-    Output('download-terminator-plot', 'data'),
+    Output('download-plots', 'data'),
     Input('download-button', 'n_clicks'),
-    State('plots', 'data'),
+    State('session', 'data'),
+    # on the workers of the analysis, which pre-render the images
+    background=True,
+    running=[(Output('download-button', 'disabled'), True, False)],
     prevent_initial_call=True,
 )
-def download_terminator_data(download_click, plots_storage):
-    if download_click > 0:
-        fig = pio.from_json(orjson.dumps(plots_storage['terminator-plot']))
-        img_bytes = fig.to_image(format="png", scale=10)
-        img_name = "mywaddle-callender.png"
-        return dcc.send_bytes(img_bytes, img_name)
+def download_plots(download_click, session_key):
+    plots = session.load_figures(session_key)
+    if download_click > 0 and plots is not None:
+        from backend import export
+        return dcc.send_bytes(export.export_zip(plots), "mywaddle.zip")
     raise PreventUpdate
 
 @app.callback(
@@ -446,7 +570,7 @@ def download_sample_data(download_click):
 
 @app.callback(
     Output("url", "href"),
-    Output('plots', 'clear_data'),
+    Output('session', 'clear_data', allow_duplicate=True),
     Input("waddle-small-logo", "n_clicks"),
     Input("warn-close", "n_clicks"),
     prevent_initial_call=True,
@@ -487,4 +611,6 @@ def console_log(children, data):
 
 
 if __name__ == '__main__':
+    from backend import renderer
+    renderer.start_server()
     app.run(debug=False)
\ No newline at end of file
@@ -0,0 +1,33 @@
+// Figures of the results view, fetched from /figure when their tab is first
+// shown. Once the active tab is drawn the other figures are prefetched.
+window.skypewaddleFigures = (function () {
+    const figures = new Map();
+
+    function fetchFigure(session, plotId) {
+        const key = session + '/' + plotId;
+        if (!figures.has(key)) {
+            const url = '/figure/' + encodeURIComponent(session) + '/' +
+                        encodeURIComponent(plotId);
+            figures.set(key, fetch(url).then(response => {
+                if (!response.ok) {
+                    figures.delete(key);
+                    return null;
+                }
+                return response.json();
+            }));
+        }
+        return figures.get(key);
+    }
+
+    function load(session, plotId, plotIds) {
+        return fetchFigure(session, plotId).then(figure => {
+            if (figure !== null) {
+                // after the active figure is drawn
+                setTimeout(() => plotIds.forEach(id => fetchFigure(session, id)));
+            }
+            return figure;
+        });
+    }
+
+    return {load: load};
+})();
@@ -0,0 +1,56 @@
+// Sends the selected export as the raw body of a POST to /upload instead of
+// a base64 data url through the callbacks. The returned token is handed to
+// Dash by clicking the hidden upload-done button.
+(function () {
+    const MAX_SIZE = 100000000;
+
+    function done(upload) {
+        window.skypewaddleUpload = upload;
+        document.getElementById('upload-done').click();
+    }
+
+    function send(file) {
+        if (!file) {
+            return;
+        }
+        if (file.size > MAX_SIZE) {
+            done({error: 'File is too large.'});
+            return;
+        }
+        fetch('/upload?filename=' + encodeURIComponent(file.name), {
+            method: 'POST',
+            headers: {'Content-Type': 'application/octet-stream'},
+            body: file,
+        })
+            .then(response => response.json())
+            .then(body => done(body.error ? {error: body.error}
+                                          : {token: body.token,
+                                             filename: file.name}))
+            .catch(() => done({error: 'The upload failed.'}));
+    }
+
+    function inDropZone(event) {
+        return event.target.closest && event.target.closest('#upload-data');
+    }
+
+    document.addEventListener('click', event => {
+        if (inDropZone(event)) {
+            const input = document.createElement('input');
+            input.type = 'file';
+            input.accept = '.json,.tar';
+            input.addEventListener('change', () => send(input.files[0]));
+            input.click();
+        }
+    });
+    document.addEventListener('dragover', event => {
+        if (inDropZone(event)) {
+            event.preventDefault();
+        }
+    });
+    document.addEventListener('drop', event => {
+        if (inDropZone(event)) {
+            event.preventDefault();
+            send(event.dataTransfer.files[0]);
+        }
+    });
+})();
@@ -0,0 +1,96 @@
+"""Extraction of the calls with every conversation partner at once
+
+The process pool is handed the byte spans of the MessageLists in the
+stored export, each worker reads, decodes and extracts its conversations.
+The combined calls are stored like those of a single conversation partner
+under the partner id store.EVERYONE.
+"""
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import orjson
+import pandas as pd
+
+from backend import extract, store
+from backend.progress import as_reporter
+
+
+def extract_everyone(set_progress, export_key, max_workers=None):
+    """ extracts the calls of every conversation partner of a stored export
+
+    Conversations without calls or with unusable call data are left out.
+
+    Arguments:
+        set_progress {callable} -- progress callback of the background job
+                                   or a ProgressReporter
+        export_key {str} -- key of the stored export
+        max_workers {int} -- size of the process pool, all available cores
+                             by default, in a daemonic process such as a
+                             Celery pool worker the conversations are
+                             extracted in this process
+
+    Returns:
+        pd.DataFrame -- dataframe with one row per call in UTC like
+                        extract.extract_utc_calls and the id of the
+                        conversation partner in the column Partner
+    """
+    conversations = [entry for entry in store.load_index(export_key)
+                     if entry['span'] is not None and
+                     not entry['header']['id'].endswith('.skype')]
+    if max_workers is None:
+        max_workers = available_cores()
+    if multiprocessing.current_process().daemon:
+        # daemonic processes are not allowed to have children
+        max_workers = 1
+    max_workers = max(min(max_workers, len(conversations)), 1)
+
+    progress = as_reporter(set_progress)
+    progress.stage('extract', len(conversations))
+    tables = []
+    path = store.export_path(export_key)
+    tasks = [(entry['header']['id'], path, entry['span'])
+             for entry in conversations]
+
+    if max_workers == 1:
+        for i, task in enumerate(tasks):
+            tables.append(_extract_partner(*task))
+            progress.advance(i + 1)
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            futures = [pool.submit(_extract_partner, *task) for task in tasks]
+            for i, future in enumerate(as_completed(futures)):
+                tables.append(future.result())
+                progress.advance(i + 1)
+
+    tables = [table for table in tables if table is not None]
+    if not tables:
+        raise ValueError("No calls found in the selected time range.")
+    return pd.concat(tables).sort_values(['Partner', 'Start Time'])
+
+
+def available_cores():
+    """cores this process may run on"""
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def _read_span(path, span):
+    start, end = span
+    with open(path, 'rb') as f:
+        f.seek(start)
+        return f.read(end - start)
+
+
+def _extract_partner(partner, path, span):
+    """runs in the pool, extracts one MessageList read from its span"""
+    try:
+        calls = extract.extract_utc_calls(lambda progress: None,
+                                          orjson.loads(_read_span(path, span)))
+    except ValueError:
+        return None
+    if calls.empty:
+        return None
+    calls['Partner'] = partner
+    return calls
@@ -0,0 +1,150 @@
+"""Cache of results derived from an export
+
+Entries are keyed by the content hash of the export (see backend.store),
+the conversation partner and the timezone, never by the upload itself.
+The cache is a diskcache shared by all workers of a machine, bounded in
+size with least-recently-used eviction and counting hits and misses.
+
+The background workers may run on another machine than the web process
+that received the upload. Exports are then also kept in backend.shared for
+EXPORT_TIMEOUT seconds, from where fetch_export copies them into the local
+store.
+"""
+import os
+
+import diskcache
+
+from backend import shared, store
+
+RESULT_CACHE_DIR = os.environ.get('RESULT_CACHE_DIR',
+                                  os.path.join('cache', 'results'))
+COUNTER_DIR = os.environ.get('COUNTER_CACHE_DIR',
+                             os.path.join('cache', 'counters'))
+RESULT_CACHE_SIZE = int(os.environ.get('RESULT_CACHE_SIZE', 256 * 2**20))
+EXPORT_CACHE_SIZE = int(os.environ.get('EXPORT_CACHE_SIZE', 2**30))
+RESULT_TIMEOUT = 3600
+# the shared copy is only needed until the worker stored the export, it
+# must not crowd out the results of the Celery backend in Redis
+EXPORT_TIMEOUT = int(os.environ.get('EXPORT_TIMEOUT', 15 * 60))
+
+_MISSING = object()
+_results = None
+_counters = None
+
+
+def results():
+    """the diskcache holding derived results, opened on first use"""
+    global _results
+    if _results is None:
+        _results = diskcache.Cache(RESULT_CACHE_DIR,
+                                   size_limit=RESULT_CACHE_SIZE,
+                                   eviction_policy='least-recently-used',
+                                   statistics=1)
+    return _results
+
+
+def counters():
+    """the diskcache holding the hit and miss counters of the exports"""
+    global _counters
+    if _counters is None:
+        _counters = diskcache.Cache(COUNTER_DIR, eviction_policy='none')
+    return _counters
+
+
+def result_key(kind, export_key, partner_id, timezone):
+    return f"{kind}:{export_key}:{partner_id}:{timezone}"
+
+
+def get_or_compute(kind, export_key, partner_id, timezone, compute):
+    """ returns the cached result or computes and stores it
+
+    Arguments:
+        kind {str} -- kind of result, e.g. 'calls' or 'plots'
+        export_key {str} -- content hash of the export
+        partner_id {str} -- id of the conversation partner
+        timezone {str} -- timezone of interest
+        compute {callable} -- computes the result if it is not cached
+
+    Returns:
+        the cached or computed result
+    """
+    return cached(result_key(kind, export_key, partner_id, timezone), compute)
+
+
+def cached(key, compute):
+    """ returns the result cached under key or computes and stores it
+
+    Arguments:
+        key {str} -- key of the result cache
+        compute {callable} -- computes the result if it is not cached
+
+    Returns:
+        the cached or computed result
+    """
+    value = results().get(key, default=_MISSING)
+    if value is _MISSING:
+        value = compute()
+        results().set(key, value, expire=RESULT_TIMEOUT)
+    return value
+
+
+def save_export_file(path, key):
+    """stores a messages.json written to path and evicts the least recently
+    used exports beyond EXPORT_CACHE_SIZE, hits and misses are counted"""
+    _count_export(key)
+    store.save_export_file(path, key)
+    if shared.remote():
+        shared.put_file(_shared_key(key), store.export_path(key),
+                        EXPORT_TIMEOUT)
+    store.evict_exports(EXPORT_CACHE_SIZE, keep=key)
+    return key
+
+
+def fetch_export(key):
+    """ makes sure an export is stored on this machine
+
+    An export saved on another machine is copied from backend.shared.
+
+    Arguments:
+        key {str} -- key of the export
+
+    Returns:
+        bool -- whether the export is stored, False if it expired
+    """
+    if store.has_export(key):
+        return True
+    if not shared.remote() or not store.is_key(key):
+        return False
+    path = store.temporary_path('.download')
+    try:
+        with open(path, 'wb') as f:
+            if not shared.get_file(_shared_key(key), f):
+                return False
+        store.save_export_file(path, key)
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
+    store.evict_exports(EXPORT_CACHE_SIZE, keep=key)
+    return True
+
+
+def _shared_key(key):
+    return f"export:{key}"
+
+
+def _count_export(key):
+    counter = 'export_hits' if store.has_export(key) else 'export_misses'
+    counters().incr(counter, retry=True)
+
+
+def stats():
+    """hit and miss counters and sizes of the caches"""
+    hits, misses = results().stats()
+    return {
+        'result_hits': hits,
+        'result_misses': misses,
+        'result_bytes': results().volume(),
+        'export_hits': counters().get('export_hits', 0),
+        'export_misses': counters().get('export_misses', 0),
+        'export_bytes': store.exports_size(),
+    }
@@ -0,0 +1,197 @@
+"""Compact representation of the UTC call table
+
+extract.extract_utc_calls builds a dataframe of python strings and
+timestamps. For caching and sharing between workers the same data is
+kept in a CallTable of plain numpy columns:
+
+    call_id, id             fixed width utf-8 bytes, b'' if missing
+    start, end              int64 seconds since the epoch (UTC),
+                            MISSING_TIME if missing
+    duration                float32 seconds, NaN if missing
+    weekday                 int8 (0 = Monday) in UTC, -1 if missing
+    caller, terminator      int16 codes into participants, -1 if missing
+    partner                 int16 codes into participants, only in tables
+                            of several conversations (see backend.batch)
+
+On disk every column is a .npy file next to participants.json, so that
+tables can be memory-mapped instead of unpickled.
+"""
+import os
+import sys
+from zoneinfo import ZoneInfo
+
+import numpy as np
+import orjson
+import pandas as pd
+
+from backend.extract import CALL_COLUMNS
+
+MISSING_TIME = np.iinfo(np.int64).min
+COLUMNS = ['call_id', 'id', 'start', 'end', 'duration', 'weekday', 'caller',
+           'terminator']
+OPTIONAL_COLUMNS = ['partner']
+
+
+class CallTable:
+    """ call table as numpy columns
+
+    Arguments:
+        columns {dict} -- numpy array for every name in COLUMNS and
+                          optionally in OPTIONAL_COLUMNS
+        participants {np.ndarray} -- user ids the caller, terminator and
+                                     partner codes refer to
+    """
+
+    def __init__(self, columns, participants):
+        self.columns = columns
+        self.participants = participants
+
+    def __len__(self):
+        return len(self.columns['call_id'])
+
+    @classmethod
+    def from_frame(cls, df):
+        """ encodes a dataframe of extract.extract_utc_calls
+
+        Arguments:
+            df {pd.DataFrame} -- dataframe with one row per call in UTC,
+                                 optionally with the column Partner
+
+        Returns:
+            CallTable -- the same calls
+        """
+        users = [df['Caller'], df['Terminator']]
+        if 'Partner' in df:
+            users.append(df['Partner'])
+        codes, participants = pd.factorize(pd.concat(users, ignore_index=True))
+        codes = np.split(codes.astype(np.int16), len(users))
+        weekday = df['Weekday'].fillna(-1).to_numpy().astype(np.int8)
+        columns = {
+            'call_id': _encode_strings(df.index.to_series()),
+            'id': _encode_strings(df['ID']),
+            'start': _encode_times(df['Start Time']),
+            'end': _encode_times(df['End Time']),
+            'duration': df['Duration'].to_numpy(dtype=np.float32),
+            'weekday': weekday,
+            'caller': codes[0],
+            'terminator': codes[1],
+        }
+        if 'Partner' in df:
+            columns['partner'] = codes[2]
+        return cls(columns, np.asarray(participants, dtype=object))
+
+    def to_frame(self):
+        """ decodes the table to a dataframe like extract.extract_utc_calls
+
+        Returns:
+            pd.DataFrame -- dataframe with one row per call in UTC and the
+                            column Partner if the table has partners
+        """
+        columns = self.columns
+        weekday = columns['weekday'].astype(float)
+        weekday[columns['weekday'] < 0] = np.nan
+        df = pd.DataFrame({
+            'Caller': self._decode_participants(columns['caller']),
+            'Duration': columns['duration'].astype(float),
+            'End Time': _decode_times(columns['end']),
+            'ID': _decode_strings(columns['id']),
+            'Start Time': _decode_times(columns['start']),
+            'Terminator': self._decode_participants(columns['terminator']),
+            'Weekday': weekday,
+        }, index=pd.Index(_decode_strings(columns['call_id']), name='Call ID'))
+        if 'partner' in columns:
+            df['Partner'] = self._decode_participants(columns['partner'])
+            return df[CALL_COLUMNS + ['Partner']]
+        return df[CALL_COLUMNS]
+
+    def save(self, directory):
+        """ writes one .npy file per column and participants.json
+
+        Arguments:
+            directory {str} -- existing directory to write to
+        """
+        for name in COLUMNS + OPTIONAL_COLUMNS:
+            if name not in self.columns:
+                continue
+            np.save(os.path.join(directory, f"{name}.npy"), self.columns[name])
+        with open(os.path.join(directory, 'participants.json'), 'wb') as f:
+            f.write(orjson.dumps(list(self.participants)))
+
+    @classmethod
+    def load(cls, directory, mmap_mode='r'):
+        """ reads a table written by save
+
+        Arguments:
+            directory {str} -- directory the table was saved to
+            mmap_mode {str} -- np.load mmap_mode of the columns, the
+                               default maps them read only
+
+        Returns:
+            CallTable -- the saved calls
+        """
+        columns = {name: np.load(os.path.join(directory, f"{name}.npy"),
+                                 mmap_mode=mmap_mode)
+                   for name in COLUMNS}
+        for name in OPTIONAL_COLUMNS:
+            path = os.path.join(directory, f"{name}.npy")
+            if os.path.exists(path):
+                columns[name] = np.load(path, mmap_mode=mmap_mode)
+        with open(os.path.join(directory, 'participants.json'), 'rb') as f:
+            participants = np.asarray(orjson.loads(f.read()), dtype=object)
+        return cls(columns, participants)
+
+    @property
+    def nbytes(self):
+        """bytes used by the columns and the participant ids"""
+        return (sum(column.nbytes for column in self.columns.values()) +
+                self.participants.nbytes +
+                sum(sys.getsizeof(user) for user in self.participants))
+
+    def _decode_participants(self, codes):
+        users = np.append(self.participants, np.nan).astype(object)
+        return users[codes]
+
+
+def memory_report(df):
+    """ compares the memory used by a call dataframe and its CallTable
+
+    Arguments:
+        df {pd.DataFrame} -- dataframe of extract.extract_utc_calls
+
+    Returns:
+        dict -- rows, bytes of the dataframe (including python strings),
+                bytes of the CallTable and their ratio
+    """
+    frame_bytes = int(df.memory_usage(deep=True).sum())
+    table_bytes = CallTable.from_frame(df).nbytes
+    return {
+        'rows': len(df),
+        'frame_bytes': frame_bytes,
+        'table_bytes': table_bytes,
+        'ratio': frame_bytes / table_bytes if table_bytes else float('nan'),
+    }
+
+
+def _encode_strings(values):
+    return np.array([value.encode('utf-8') if isinstance(value, str) else b''
+                     for value in values], dtype=bytes)
+
+
+def _decode_strings(values):
+    strings = np.char.decode(values, 'utf-8').astype(object)
+    strings[values == b''] = np.nan
+    return strings
+
+
+def _encode_times(times):
+    nanoseconds = times.dt.tz_convert('UTC').dt.tz_localize(None).to_numpy()
+    nanoseconds = nanoseconds.view(np.int64)
+    missing = nanoseconds == MISSING_TIME
+    return np.where(missing, MISSING_TIME, nanoseconds // 10**9)
+
+
+def _decode_times(seconds):
+    missing = seconds == MISSING_TIME
+    nanoseconds = np.where(missing, MISSING_TIME, seconds * 10**9)
+    return pd.DatetimeIndex(nanoseconds.view('datetime64[ns]')).tz_localize(
+        ZoneInfo('UTC')).array
@@ -1,35 +1,71 @@
-from datetime import date
-from typing import Dict, cast
+from typing import Any, Dict
 
 import numpy as np
 import pandas as pd
 import plotly.graph_objects as go
-from plotly_calplot import calplot
 
 LOGO_URL = "https://raw.githubusercontent.com/stephanzwicknagl/skypewaddle/d29015c1bd3f859d5bcd4fd0f774553703aa65e1/assets/icon-192x192.png"
+CALENDAR_MONTHS = ["January", "February", "March", "April", "May", "June",
+                   "July", "August", "September", "October", "November",
+                   "December"]
+WEEKDAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday",
+            "Saturday", "Sunday"]
 
-def weekday_plot(df: pd.DataFrame) -> go.Figure:
+
+def summarize(df: pd.DataFrame) -> Dict[str, Any]:
+    """ aggregates everything the plots show in one pass over the calls
+
+    Arguments:
+        df {pd.DataFrame} -- dataframe with call data
+
+    Returns:
+        dict -- first_day {str} -- first day with a call (YYYY-MM-DD)
+                daily {np.ndarray} -- seconds called per day from first_day
+                                      to the last day with a call
+                weekday {np.ndarray} -- seconds called per weekday, Monday first
+                callers {dict} -- calls started per user id
+                terminators {dict} -- calls ended per user id
+                calls {int} -- number of calls
+                duration {float} -- seconds called in total
+    """
+    start = df["Start Time"]
+    duration = df["Duration"].fillna(0).to_numpy()
+    has_start = start.notna().to_numpy()
+
+    days = start.dt.tz_localize(None).dt.normalize()
+    first_day = days.min()
+    day_index = ((days - first_day) // pd.Timedelta(days=1)).to_numpy()
+    daily = np.bincount(day_index[has_start].astype(int),
+                        weights=duration[has_start])
+
+    # the weekday of each call is already known from extraction
+    weekday = df["Weekday"].to_numpy(dtype=float)
+    has_weekday = ~np.isnan(weekday)
+    weekday = np.bincount(weekday[has_weekday].astype(int),
+                          weights=duration[has_weekday], minlength=7)
+
+    return {
+        'first_day': first_day.strftime("%Y-%m-%d"),
+        'daily': daily,
+        'weekday': weekday,
+        'callers': df["Caller"].value_counts().sort_index().to_dict(),
+        'terminators': df["Terminator"].value_counts().sort_index().to_dict(),
+        'calls': len(df.index.unique()),
+        'duration': df["Duration"].sum(),
+    }
+
+
+def weekday_plot(summary: Dict[str, Any]) -> go.Figure:
     week = pd.DataFrame(
         {
-            'Day': [
-                "Monday", "Tuesday", "Wednesday", "Thursday", "Friday",
-                "Saturday", "Sunday"
-            ],
+            'Day': WEEKDAYS,
             'Duration':
             np.zeros(7),
             'Avg':
             np.zeros(7)
         },
         columns=['Day', 'Duration', 'Avg']).set_index("Day")
-    for _, row in df.iterrows():
-        try:
-            day = int(cast(date, row["Start Time"]).weekday())
-            value = row["Duration"]
-        except ValueError:
-            continue
-
-        value = row["Duration"]
-        week.iloc[day].loc['Duration'] += value if value == value else 0
+    week.loc[:, 'Duration'] = summary['weekday']
 
     fig = go.Figure()
 
@@ -57,28 +93,77 @@ def weekday_plot(df: pd.DataFrame) -> go.Figure:
     return fig
 
 
-def calendar_plot(df: pd.DataFrame) -> go.Figure:
-    start_date = df["Start Time"].min().date()
-    end_date = df["Start Time"].max().date()
-
+def calendar_plot(summary: Dict[str, Any]) -> go.Figure:
+    """
+    Plot a calendar heatmap of the hours called per day, one row per year.
+    The figure is assembled from plain dicts, going through plotly's
+    subplot and update helpers is much slower for long histories.
+    """
     # sum of duration per day in hours
-    day_durations = df.groupby(pd.Grouper(key="Start Time",
-                                          freq="D"))["Duration"].sum() / 3600
-    df = pd.DataFrame({
-        "ds": pd.date_range(start_date, end_date),
-        "value": day_durations,
-    })
-
-    fig = calplot(df,
-                  x="ds",
-                  y="value",
-                  name="Call Duration in Hours",
-                  gap=0,
-                  month_lines_width=3,
-                  month_lines_color="#eeeeff",
-                  colorscale="Teal",
-                  years_title=True)
+    days = pd.date_range(summary['first_day'], periods=len(summary['daily']))
+    hours = np.round(summary['daily'] / 3600, 2)
+    years = list(range(days[0].year, days[-1].year + 1))
+
+    # 170px per year: the year title, the heatmap and the month names
+    height = 170 * len(years)
+    spacing = 50 / height
+    row_height = (1 - 25 / height - spacing * (len(years) - 1)) / len(years)
+    data, layout = [], {'annotations': []}
+    for row, year in enumerate(years):
+        grid, dates, month_columns, separators = _calendar_year(
+            year, days, hours)
+        suffix = str(row + 1) if row else ''
+        top = 1 - 25 / height - row * (row_height + spacing)
+        data.append(dict(type="heatmap",
+                         z=grid,
+                         customdata=dates,
+                         name=str(year),
+                         hovertemplate="%{customdata}<br>"
+                         "Call Duration in Hours=%{z}<extra></extra>",
+                         colorscale="Teal",
+                         zmin=0,
+                         zmax=max(hours.max(), 1e-9),
+                         showscale=False,
+                         xgap=0,
+                         ygap=0,
+                         xaxis=f"x{suffix}",
+                         yaxis=f"y{suffix}"))
+        data.append(dict(type="scatter",
+                         x=separators[0],
+                         y=separators[1],
+                         mode="lines",
+                         line=dict(color="#eeeeff", width=3),
+                         hoverinfo="skip",
+                         xaxis=f"x{suffix}",
+                         yaxis=f"y{suffix}"))
+        layout[f"xaxis{suffix}"] = dict(anchor=f"y{suffix}",
+                                        domain=[0, 1],
+                                        tickmode="array",
+                                        tickvals=month_columns,
+                                        ticktext=CALENDAR_MONTHS,
+                                        showgrid=False, showline=False,
+                                        zeroline=False)
+        layout[f"yaxis{suffix}"] = dict(anchor=f"x{suffix}",
+                                        domain=[max(top - row_height, 0), top],
+                                        tickmode="array",
+                                        tickvals=list(range(7)),
+                                        ticktext=[day[:3] for day in WEEKDAYS],
+                                        autorange="reversed",
+                                        showgrid=False, showline=False,
+                                        zeroline=False)
+        layout['annotations'].append(dict(text=str(year),
+                                          font=dict(size=16),
+                                          showarrow=False,
+                                          x=0.5, xanchor="center",
+                                          xref="paper",
+                                          y=top, yanchor="bottom",
+                                          yref="paper"))
+
+    fig = go.Figure(data=data, layout=layout)
     fig.update_layout(
+        height=height,
+        showlegend=False,
+        font=dict(color="#9e9e9e", size=10),
         paper_bgcolor='rgb(248, 248, 255)',
         plot_bgcolor='rgb(248, 248, 255)',
         margin=dict(l=0, r=0, t=0, b=0),
@@ -96,8 +181,48 @@ def calendar_plot(df: pd.DataFrame) -> go.Figure:
     return fig
 
 
-def duration_plot(df: pd.DataFrame) -> go.Figure:
-    sum = df["Duration"].sum()
+def _calendar_year(year: int, days: pd.DatetimeIndex, hours: np.ndarray):
+    """ lays out one year of daily hours as a (7 x weeks) grid
+
+    Returns:
+        tuple -- grid of hours (days without calls 0, cells outside the
+                 year NaN), grid of dates, column in the middle of each
+                 month and x, y of the month separators
+    """
+    year_days = pd.date_range(f"{year}-01-01", f"{year}-12-31")
+    offset = year_days[0].weekday()
+    position = np.arange(len(year_days)) + offset
+    columns, weekdays = position // 7, position % 7
+    n_columns = columns[-1] + 1
+
+    values = np.zeros(len(year_days))
+    in_year = (days.year == year)
+    values[(days[in_year] - year_days[0]).days] = hours[in_year]
+    grid = np.full((7, n_columns), np.nan)
+    grid[weekdays, columns] = values
+    dates = np.full((7, n_columns), None, dtype=object)
+    dates[weekdays, columns] = year_days.strftime("%Y-%m-%d")
+
+    month = year_days.month.to_numpy()
+    month_columns = [columns[month == m].mean() for m in range(1, 13)]
+
+    # a step line left of the first day of every month but January
+    x, y = [], []
+    for first in np.flatnonzero(year_days.day == 1)[1:]:
+        column, weekday = columns[first], weekdays[first]
+        x += [column - 0.5, column - 0.5]
+        y += [6.5, weekday - 0.5]
+        if weekday > 0:
+            x += [column + 0.5, column + 0.5]
+            y += [weekday - 0.5, -0.5]
+        x.append(None)
+        y.append(None)
+
+    return grid, dates, month_columns, (x, y)
+
+
+def duration_plot(summary: Dict[str, Any]) -> go.Figure:
+    sum = summary['duration']
     unit = "hours" if sum > 3600 else "minutes"
     sum = sum / 3600 if sum > 3600 else sum / 60
 
@@ -113,7 +238,7 @@ def duration_plot(df: pd.DataFrame) -> go.Figure:
                      }))
     fig.add_trace(
         go.Indicator(mode="number",
-                     value=len(df.index.unique()),
+                     value=summary['calls'],
                      number={"suffix": f" calls! 📞"},
                      title={"text": "Over"},
                      domain={
@@ -137,12 +262,12 @@ def duration_plot(df: pd.DataFrame) -> go.Figure:
     return fig
 
 
-def terminator_plot(df: pd.DataFrame, participant: Dict[str, str])  -> go.Figure:
+def terminator_plot(summary: Dict[str, Any], participant: Dict[str, str])  -> go.Figure:
     """
     Plot a bar chart comparing the number of "terminations" per person.
     A termination is defined as a call that was hung up by one of the participants.
     """
-    counts = df["Terminator"].value_counts().sort_index()
+    counts = pd.Series(summary['terminators'], dtype='int64')
     fig = go.Figure()
     fig.add_trace(
         go.Bar(x=counts.index,
@@ -178,11 +303,11 @@ def terminator_plot(df: pd.DataFrame, participant: Dict[str, str])  -> go.Figure
     return fig
 
 
-def caller_plot(df: pd.DataFrame, participant: Dict[str, str]) -> go.Figure:
+def caller_plot(summary: Dict[str, Any], participant: Dict[str, str]) -> go.Figure:
     """
     Plot a bar chart comparing the number of call initiations per person.
     """
-    counts = df["Caller"].value_counts().sort_index()
+    counts = pd.Series(summary['callers'], dtype='int64')
 
     fig = go.Figure()
     fig.add_trace(
@@ -0,0 +1,114 @@
+"""PNG export of the plots
+
+Images are cached by the content hash of their figure, so downloading the
+same plots again does not render them again. Right after an analysis the
+render server starts on the images, a download waits for a render of the
+same figure that is in flight instead of starting another one.
+"""
+import hashlib
+import io
+import logging
+import zipfile
+
+import orjson
+
+from backend import cache, renderer
+
+IMAGE_NAMES = {
+    'duration-plot': "mywaddle-duration.png",
+    'weekday-plot': "mywaddle-weekdays.png",
+    'calendar-plot': "mywaddle-year.png",
+    'caller-plot': "mywaddle-caller.png",
+    'terminator-plot': "mywaddle-callender.png",
+}
+SCALE = 10
+
+logger = logging.getLogger(__name__)
+
+
+def figure_key(figure):
+    """ content hash of a figure
+
+    Arguments:
+        figure {dict} -- plotly json of the figure, e.g. from dcc.Store
+
+    Returns:
+        str -- sha256 of the figure json with sorted keys
+    """
+    return hashlib.sha256(orjson.dumps(
+        figure,
+        option=orjson.OPT_SORT_KEYS | orjson.OPT_SERIALIZE_NUMPY)).hexdigest()
+
+
+def render_png(figure):
+    """ renders a figure to png or returns the cached image
+
+    Arguments:
+        figure {dict} -- plotly json of the figure
+
+    Returns:
+        bytes -- the png image
+    """
+    key = _png_key(figure)
+    png = cache.results().get(key)
+    if png is None:
+        png = _to_png(key, figure)
+    return png
+
+
+def prerender(figures):
+    """ queues the images of freshly built plots in the render server
+
+    The server renders them after the callback returned, downloads waiting
+    at the same time go first. Without a render server nothing is rendered
+    ahead.
+
+    Arguments:
+        figures {dict} -- plotly json of the figures by plot id
+    """
+    for plot_id in IMAGE_NAMES:
+        key = _png_key(figures[plot_id])
+        if key in cache.results():
+            continue
+        try:
+            renderer.render(key, _dumps(figures[plot_id]), SCALE, wait=False)
+        except ConnectionError:
+            return
+
+
+def export_zip(plots):
+    """ renders all plots and packs them into one zip
+
+    The figures are rendered by the render server, see backend.renderer.
+
+    Arguments:
+        plots {dict} -- plotly json of the figures by plot id
+
+    Returns:
+        bytes -- zip with one png per plot
+    """
+    buffer = io.BytesIO()
+    # pngs are compressed already
+    with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_STORED) as zf:
+        for plot_id, name in IMAGE_NAMES.items():
+            zf.writestr(name, render_png(plots[plot_id]))
+    return buffer.getvalue()
+
+
+def _png_key(figure):
+    return f"png:{SCALE}:{figure_key(figure)}"
+
+
+def _dumps(figure):
+    return orjson.dumps(figure, option=orjson.OPT_SERIALIZE_NUMPY)
+
+
+def _to_png(key, figure):
+    try:
+        return renderer.render(key, _dumps(figure), SCALE)
+    except ConnectionError:
+        # e.g. in a shell, the pool then lives as long as this process
+        logger.warning("No render server is running, rendering in process")
+        png = renderer.pool().render(_dumps(figure), SCALE)
+        cache.results().set(key, png, expire=cache.RESULT_TIMEOUT)
+        return png
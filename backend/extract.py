@@ -1,82 +1,203 @@
-import datetime
+import re
 from zoneinfo import ZoneInfo
 
 import numpy as np
 import pandas as pd
 import lxml.etree as ET
 
+from backend.progress import as_reporter
+
+START_COLUMNS = ['Call ID', 'Order', 'ID', 'Start Time', 'Caller']
+END_COLUMNS = ['Call ID', 'Order', 'ID', 'End Time', 'Duration', 'Terminator']
+END_CARRIED_COLUMNS = ['End Time', 'Duration', 'Terminator']
+CALL_COLUMNS = ['Caller', 'Duration', 'End Time', 'ID', 'Start Time',
+                'Terminator', 'Weekday']
+
+# call event content the fast path understands: a <partlist> whose children
+# are elements (e.g. <part>) that only contain elements with plain text.
+# lxml turns tabs and newlines in attribute values into spaces, such values
+# are left to lxml.
+_PARTLIST = re.compile(
+    r'\s*+<partlist((?:\s++[\w:.-]++="[^"<>&\t\n\r]*+")*+)\s*+>')
+_PARTLIST_BODY = re.compile(
+    r'(?:[^<]*+<([\w:.-]++)(?:\s[^<>]*+)?(?<!/)>'
+    r'(?:[^<]*+<([\w:.-]++)(?:\s[^<>]*+)?(?<!/)>[^<]*+</\2>)*+'
+    r'[^<]*+</\1>)*+[^<]*+</partlist>\s*+')
+_TYPE = re.compile(r'(?:\s+[\w:.-]+="[^"]*")*?\s+type="([^"]*)"')
+_CALL_ID = re.compile(r'(?:\s+[\w:.-]+="[^"]*")*?\s+callId="([^"]*)"')
+_PART = re.compile(r'<part(?:\s[^<>]*+)?>(.*?)</part>', re.DOTALL)
+_DURATION = re.compile(r'<duration(?:\s[^<>]*+)?>([^<]*+)</duration>')
 
-def extract_conversations(conversations):
-    """
-    Extracts all conversation partners from file and lets user choose one.
+def get_calls(set_progress, conversations, partner_index, my_timezone):
+    """ takes json file path and extracts call data
 
     Arguments:
-        path {str} -- path to json file from skype structure ['conversations']
-        teset {bool} -- if True, then function returns before user input
+        path {str} -- path to json file from skype structure ['conversations'][partner_index]['MessageList']
+        partner_index {str} -- index of the conversation partner
+        my_timezone {str} -- timezone of interest
 
     Returns:
-        option -- the conversation partner picked or if test list of all conversation partners
-        indexes -- index of the chosen partner or if test a dictionary with all conversation partner as key and their index as value
+        pd.DataFrame -- dataframe with call data
     """
-
-    participants = []
-    for i in range(0, len(conversations)):
-        userid = conversations[i]['id']
-        if not userid.endswith('.skype'):
-            partner = conversations[i]['displayName'] if conversations[i]['displayName'] \
-                is not None and userid.startswith('8:') else userid
-            participants.append({'label': partner, 'username': userid})
-    return participants
+    messages = conversations[partner_index]['MessageList']
+    return extract_calls(set_progress, messages, my_timezone)
 
 
-def get_calls(set_progress, conversations, partner_index, my_timezone):
-    """ takes json file path and extracts call data
+def extract_calls(set_progress, messages, my_timezone):
+    """ extracts call data from the messages of one conversation
 
     Arguments:
-        path {str} -- path to json file from skype structure ['conversations'][partner_index]['MessageList']
-        partner_index {str} -- index of the conversation partner
+        set_progress {callable} -- progress callback of the background job
+                                   or a ProgressReporter
+        messages {list} -- skype structure ['conversations'][partner_index]['MessageList']
         my_timezone {str} -- timezone of interest
 
     Returns:
         pd.DataFrame -- dataframe with call data
     """
+    return project_calls(extract_utc_calls(set_progress, messages),
+                         my_timezone)
 
-    # initialize dataframe
-    df = pd.DataFrame(columns=[
-        'Call ID', 'ID', 'Start Time', 'End Time', 'Duration', 'Weekday',
-        'Caller', 'Terminator'
-    ])
-    df.set_index('Call ID', inplace=True)
 
-    messages = conversations[partner_index]['MessageList']
+def extract_utc_calls(set_progress, messages):
+    """ extracts the timezone independent call table of a conversation
 
-    # iterate over messages with a progress bar
-    for i,obj in enumerate(messages):
-        set_progress((str(i), str(len(messages))))
-        # not-calls are ignored
-        if not is_call(obj):
-            continue
+    Call events are collected in columnar buffers (one for start and one for
+    end directives), paired by call id and turned into a dataframe once.
+    Times are kept in UTC and calls are not split at midnight yet, see
+    project_calls.
 
-        # extract call data
-        try:
-            calls = get_times(obj, my_timezone)
-        except KeyError:
-            raise ValueError("The json file is malformed.")
-        # missed calls are ignored
-        # if call is missed/etc. calls is empty
-        if calls is None:
-            continue
+    Arguments:
+        set_progress {callable} -- progress callback of the background job
+                                   or a ProgressReporter
+        messages {list} -- skype structure ['conversations'][partner_index]['MessageList']
 
-        # update dataframe with the call
-        # if call id already exists, then combine lines
-        df = df.combine_first(calls)
+    Returns:
+        pd.DataFrame -- dataframe with one row per call in UTC
+    """
+    progress = as_reporter(set_progress)
+    starts, ends = collect_call_events(progress, messages)
+
+    progress.stage('reconcile')
+    df = join_calls(starts, ends, 'UTC')
 
     if df.isna().sum().sum() > 0.1 * len(df) * len(df.columns):
         raise ValueError(
             "There are too many missing values in the call dataframe.")
 
     # some old calls don't reference call id carry information over
-    df = fix_old_ids(df)
+    return fix_old_ids(df)
+
+
+def extend_utc_calls(set_progress, messages, calls, watermark):
+    """ adds the calls of a newer export to a call table of an earlier one
+
+    Only messages after the watermark are extracted, together with the
+    earlier events of calls that were incomplete at the watermark and
+    continue in them. Their calls replace those of the earlier call table.
+
+    Arguments:
+        set_progress {callable} -- progress callback of the background job
+                                   or a ProgressReporter
+        messages {list} -- skype structure ['conversations'][partner_index]['MessageList']
+                           of the newer export
+        calls {pd.DataFrame} -- extract_utc_calls of the earlier export
+        watermark {tuple} -- get_watermark of the earlier export
+
+    Returns:
+        pd.DataFrame -- dataframe with one row per call in UTC or None if
+                        the messages do not continue the earlier export
+    """
+    time, message_id = watermark
+    continued = False
+    new_messages = []
+    old_messages = []
+    for obj in messages:
+        if obj['originalarrivaltime'] > time:
+            new_messages.append(obj)
+        else:
+            continued = continued or obj['id'] == message_id
+            old_messages.append(obj)
+    if not continued:
+        return None
+
+    progress = as_reporter(set_progress)
+    starts, ends = collect_call_events(progress, new_messages)
+
+    # only incomplete calls with new events change, their earlier events
+    # are extracted again
+    incomplete = calls.index[calls['Start Time'].isna() |
+                             calls['End Time'].isna()]
+    continued_calls = calls.loc[incomplete[
+        incomplete.isin(starts['Call ID']) | incomplete.isin(ends['Call ID'])]]
+    if not continued_calls.empty:
+        ids = set(continued_calls.index)
+        # older messages cannot be events of these calls
+        since = _earliest_event(continued_calls)
+        rescanned = {id(obj) for obj in old_messages
+                     if obj['originalarrivaltime'] >= since and
+                     is_call(obj) and parse_call_id(obj['content']) in ids}
+        # in the order of the export, which decides between duplicates
+        starts, ends = collect_call_events(progress, [
+            obj for obj in messages
+            if obj['originalarrivaltime'] > time or id(obj) in rescanned])
+
+    progress.stage('reconcile')
+    new_calls = join_calls(starts, ends, 'UTC')
+    df = pd.concat([calls.drop(calls.index.intersection(new_calls.index)),
+                    new_calls])
+
+    if df.isna().sum().sum() > 0.1 * len(df) * len(df.columns):
+        raise ValueError(
+            "There are too many missing values in the call dataframe.")
+
+    # legacy end directives only occur among the new calls
+    return fix_old_ids(df).sort_index()
+
+
+def _earliest_event(calls):
+    """arrival time from which on the events of calls are found as
+    originalarrivaltime string"""
+    times = calls['Start Time'].fillna(calls['End Time'])
+    if times.isna().any():
+        return ''
+    # event times are the arrival times without fractions of seconds
+    return times.min().tz_convert('UTC').strftime('%Y-%m-%dT%H:%M:%S')
+
+
+def get_watermark(messages):
+    """ arrival time and id of the newest message of a conversation
+
+    Arguments:
+        messages {list} -- skype structure ['conversations'][partner_index]['MessageList']
+
+    Returns:
+        tuple -- originalarrivaltime and id or None if there are no messages
+    """
+    if not messages:
+        return None
+    newest = max(messages, key=lambda obj: obj['originalarrivaltime'])
+    return newest['originalarrivaltime'], newest['id']
+
+
+def project_calls(calls, my_timezone):
+    """ shows a call table from extract_utc_calls in the timezone of interest
+
+    Times and weekdays are converted and calls that span over midnight of
+    the timezone of interest are split. The call table is not modified.
+
+    Arguments:
+        calls {pd.DataFrame} -- dataframe with one row per call in UTC
+        my_timezone {str} -- timezone of interest
+
+    Returns:
+        pd.DataFrame -- dataframe with call data
+    """
+    timezone = ZoneInfo(my_timezone)
+    df = calls.copy()
+    df['Start Time'] = df['Start Time'].dt.tz_convert(timezone)
+    df['End Time'] = df['End Time'].dt.tz_convert(timezone)
+    df['Weekday'] = df['Start Time'].dt.weekday.astype(float)
 
     # calls that span over two days are split at midnight
     df = assign_date_for_midnight(df, my_timezone)
@@ -91,6 +212,84 @@ def get_calls(set_progress, conversations, partner_index, my_timezone):
     return df
 
 
+def collect_call_events(set_progress, messages):
+    """ collects the start and end directives of a conversation
+
+    Arguments:
+        set_progress {callable} -- progress callback of the background job
+                                   or a ProgressReporter
+        messages {list} -- skype structure ['conversations'][partner_index]['MessageList']
+
+    Returns:
+        tuple -- columnar buffers (dict of lists) of start and end directives
+    """
+    starts = {column: [] for column in START_COLUMNS}
+    ends = {column: [] for column in END_COLUMNS}
+
+    # iterate over messages with a (rate limited) progress bar
+    progress = as_reporter(set_progress)
+    progress.stage('extract', len(messages))
+    for i, obj in enumerate(messages):
+        progress.advance(i)
+        # not-calls are ignored
+        if not is_call(obj):
+            continue
+
+        # extract call data
+        try:
+            event = get_times(obj)
+        except KeyError:
+            raise ValueError("The json file is malformed.")
+        # missed calls are ignored
+        # if call is missed/etc. event is empty
+        if event is None:
+            continue
+
+        event_category, record = event
+        buffer = starts if event_category == 'started' else ends
+        buffer['Order'].append(i)
+        for column, value in record.items():
+            buffer[column].append(value)
+
+    return starts, ends
+
+
+def join_calls(starts, ends, my_timezone):
+    """Pairs start and end directives by call id
+
+    Only the first directive of each kind is used per call id. The message
+    id of whichever directive came first is kept as ID.
+
+    Arguments:
+        starts {dict} -- columnar buffer of start directives
+        ends {dict} -- columnar buffer of end directives
+        my_timezone {str} -- timezone of interest
+
+    Returns:
+        pd.DataFrame -- dataframe with one row per call id
+    """
+    start_df = pd.DataFrame(starts, columns=START_COLUMNS)
+    start_df = start_df.drop_duplicates('Call ID', keep='first')
+    start_df['Start Time'] = get_call_times(start_df['Start Time'],
+                                            my_timezone)
+    start_df['Weekday'] = start_df['Start Time'].dt.weekday
+    end_df = pd.DataFrame(ends, columns=END_COLUMNS)
+    end_df = end_df.drop_duplicates('Call ID', keep='first')
+    end_df['End Time'] = get_call_times(end_df['End Time'], my_timezone)
+
+    df = start_df.merge(end_df, how='outer', on='Call ID',
+                        suffixes=(' Start', ' End'))
+    start_first = (df['Order Start'].fillna(np.inf) <
+                   df['Order End'].fillna(np.inf))
+    df['ID'] = df['ID Start'].where(start_first, df['ID End'])
+    df['Duration'] = df['Duration'].astype(float)
+    df['Weekday'] = df['Weekday'].astype(float)
+
+    df.set_index('Call ID', inplace=True)
+    df.sort_index(inplace=True)
+    return df[CALL_COLUMNS]
+
+
 def fix_old_ids(df):
     """This function carries the information
     from the end directive to the correct call id
@@ -100,13 +299,20 @@ def fix_old_ids(df):
     End Time, Duration, Terminator is carried over to the correct call 
     ID and wrong index is dropped
     """
-    for index, row in df.iterrows():
-        if len(index) <= 13:
-            df.loc[df['ID'] == index, 'End Time'] = df.loc[index, 'End Time']
-            df.loc[df['ID'] == index, 'Duration'] = df.loc[index, 'Duration']
-            df.loc[df['ID'] == index, 'Terminator'] = df.loc[index,
-                                                             'Terminator']
-            df.drop(index, inplace=True)
+    legacy = np.array([isinstance(index, str) and len(index) <= 13
+                       for index in df.index], dtype=bool)
+    if not legacy.any():
+        return df
+
+    # end directives keyed by the message id they reference
+    ends = df.loc[legacy, END_CARRIED_COLUMNS]
+    df = df.loc[~legacy].copy()
+
+    matched = df['ID'].isin(ends.index)
+    carried = df[['ID']].merge(ends, how='left', left_on='ID',
+                               right_index=True).set_axis(df.index)
+    for column in END_CARRIED_COLUMNS:
+        df[column] = df[column].where(~matched, carried[column])
 
     return df
 
@@ -117,83 +323,143 @@ def is_call(obj):
     return False
 
 
-def get_times(obj, my_timezone):
+def get_times(obj):
     """ takes one object from the json file and analyzes it
     
     Arguments:
         obj {dict} -- one object from the json file
-        my_timezone {str} -- timezone of interest
     
     Returns:
-        pd.DataFrame -- dataframe with call data
-                        [ID, Start Time, End Time, Duration, Weekday, Caller Terminator]
+        tuple -- event category ('started' or 'ended') and the call data
+                 {Call ID, ID, Start Time, Caller} or
+                 {Call ID, ID, End Time, Duration, Terminator}
+                 with the time of the event as originalarrivaltime string
     """
-    content = ET.fromstring(obj['content'], parser=ET.XMLParser(encoding='utf-8'))
+    event_category, call_id, duration = parse_call_content(obj['content'])
 
-    # get datetime of event
-    time = get_call_time(obj, my_timezone)
+    # time of event, converted for all events at once by get_call_times
+    time = obj['originalarrivaltime']
     # get caller/terminator of call
     val_from = obj['from']
-    # unique identifier for each call to match start and end later
-    call_id = content.get('callId')
     # secondary id identifier for calls before mid 2019(?)
     id_sec = obj['id']
 
-    event_category = content.get('type')
     if event_category == 'started':
-        calls = pd.DataFrame(data={
+        record = {
             'Call ID': call_id,
             'ID': id_sec,
             'Start Time': time,
-            'End Time': np.nan,
             'Caller': val_from,
-            'Weekday': time.weekday(),
-        },
-                                index=['Call ID'])
+        }
     elif event_category == 'ended':
-        duration = content.xpath('.//part[1]/duration/text()')
-        if len(duration) != 0:
-            duration = float(duration[0])
-        else:
-            duration = 0
-        calls = pd.DataFrame(data={
+        record = {
             'Call ID': call_id,
             'ID': id_sec,
-            'Start Time': np.nan,
             'End Time': time,
-            'Duration': duration,
+            'Duration': float(duration) if duration is not None else 0,
             'Terminator': val_from
-        },
-                                index=['Call ID'])
+        }
     else:
         return
-    calls.set_index('Call ID', inplace=True)
-    return calls
+    return event_category, record
 
 
-def get_call_time(obj, my_timezone):
-    time = obj['originalarrivaltime']
-    year = int(time[0:4])
-    month = int(time[5:7])
-    day = int(time[8:10])
-    hour = int(time[11:13])
-    minute = int(time[14:16])
-    second = int(time[17:19])
-
-    moment = datetime.datetime(year,
-                            month,
-                            day,
-                            hour,
-                            minute,
-                            second,
-                            tzinfo=ZoneInfo('Etc/UTC')).astimezone(
-                                ZoneInfo(my_timezone))
-    return moment
+def parse_call_content(content):
+    """ reads the xml content of a call event
+
+    Content of the usual shape is scanned with regular expressions,
+    anything else is parsed with lxml.
+
+    Arguments:
+        content {str} -- content of the call event
+
+    Returns:
+        tuple -- event category, call id (unique identifier for each call to
+                 match start and end later) and the duration text of the
+                 first participant or None
+    """
+    parsed = _scan_call_content(content)
+    if parsed is None:
+        parsed = _parse_call_content_xml(content)
+    return parsed
+
+
+def parse_call_id(content):
+    """ reads only the call id of a call event
+
+    Arguments:
+        content {str} -- content of the call event
+
+    Returns:
+        str -- the call id of parse_call_content
+    """
+    partlist = _PARTLIST.match(content)
+    if partlist is None or '&' in partlist.group(1):
+        return parse_call_content(content)[1]
+    return _match_group(_CALL_ID.match(partlist.group(1)))
+
+
+def _scan_call_content(content):
+    """fast path of parse_call_content, None if the content is unusual"""
+    partlist = _PARTLIST.match(content)
+    if (partlist is None or '&' in content or
+            _PARTLIST_BODY.fullmatch(content, partlist.end()) is None):
+        return None
+
+    attributes = partlist.group(1)
+    event_category = _match_group(_TYPE.match(attributes))
+    call_id = _match_group(_CALL_ID.match(attributes))
+    duration = None
+    if event_category == 'ended':
+        # same as xpath .//part[1]/duration/text() unless the first part
+        # has no duration and xpath would move on to other parts
+        part = _PART.search(content, partlist.end())
+        if part is not None and '<part' in part.group(1):
+            # the first </part> may close a nested part
+            return None
+        if part is not None:
+            texts = [text for text in _DURATION.findall(part.group(1))
+                     if text]
+            if texts:
+                duration = texts[0]
+            elif _PART.search(content, part.end()) is not None:
+                return None
+    return event_category, call_id, duration
+
+
+def _match_group(match):
+    return match.group(1) if match is not None else None
+
+
+def _parse_call_content_xml(content):
+    """slow path of parse_call_content using lxml"""
+    content = ET.fromstring(content, parser=ET.XMLParser(encoding='utf-8'))
+    duration = content.xpath('.//part[1]/duration/text()')
+    return (content.get('type'), content.get('callId'),
+            str(duration[0]) if len(duration) != 0 else None)
+
+
+def get_call_times(times, my_timezone):
+    """ converts the arrival times of call events to the timezone of interest
+
+    Arguments:
+        times {pd.Series} -- originalarrivaltime strings (UTC)
+        my_timezone {str} -- timezone of interest
+
+    Returns:
+        pd.Series -- timezone aware times, fractions of seconds are dropped
+    """
+    moments = pd.to_datetime(times.astype(str).str.slice(0, 19),
+                             format='%Y-%m-%dT%H:%M:%S', utc=True)
+    return moments.dt.tz_convert(ZoneInfo(my_timezone))
 
 
 def assign_date_for_midnight(df, my_timezone):
-    """Split calls that span over two days at midnight
+    """Split calls that span over midnight into one call per day
     
+    The first part keeps the Caller, the last part the Terminator. Parts
+    end at 23:59:59 and start at 00:00:00 of the timezone of interest.
+
     Arguments:
         df {pd.DataFrame} -- dataframe with call data
         my_timezone {str} -- timezone of interest
@@ -201,51 +467,47 @@ def assign_date_for_midnight(df, my_timezone):
     Returns:
         pd.DataFrame -- dataframe with call data
     """
-
-    for index, row in df.iterrows():
-        if row['Start Time'].date() != row['End Time'].date():
-            if pd.isnull(row['Start Time']) or pd.isnull(row['End Time']):
-                continue
-            date_2 = row['End Time'].date()
-            starttime_2 = datetime.datetime(
-                year=date_2.year,
-                month=date_2.month,
-                day=date_2.day,
-                hour=0,
-                minute=0,
-                second=0,
-                tzinfo=ZoneInfo(my_timezone))
-            endtime_2 = row['End Time']
-            duration_2 = float((endtime_2 - starttime_2).seconds)
-            terminator_2 = row['Terminator']
-
-            starttime_1 = row['Start Time']
-            date_1 = row['Start Time'].date()
-            endtime_1 = datetime.datetime(
-                year=date_1.year,
-                month=date_1.month,
-                day=date_1.day,
-                hour=23,
-                minute=59,
-                second=59,
-                tzinfo=ZoneInfo(my_timezone))
-            duration_1 = float((endtime_1 - starttime_1).seconds)
-            caller_1 = row['Caller']
-
-            call = pd.DataFrame(data={
-                'Call ID': [index, index],
-                'Start Time': [starttime_1, starttime_2],
-                'End Time': [endtime_1, endtime_2],
-                'Caller': [caller_1, np.nan],
-                'Terminator': [np.nan, terminator_2],
-                'Duration': [duration_1, duration_2],
-                'Weekday': [starttime_1.weekday(),
-                            starttime_2.weekday()],
-            },
-                                index=[index, index])
-            call.set_index('Call ID', inplace=True)
-
-            df = df.drop(index)
-            df = pd.concat([df, call])
-
-    return df
\ No newline at end of file
+    timezone = ZoneInfo(my_timezone)
+    start = pd.to_datetime(df['Start Time'], utc=True).dt.tz_convert(timezone)
+    end = pd.to_datetime(df['End Time'], utc=True).dt.tz_convert(timezone)
+    # calendar days in the timezone of interest
+    start_day = start.dt.tz_localize(None).dt.normalize()
+    end_day = end.dt.tz_localize(None).dt.normalize()
+    days = ((end_day - start_day) // pd.Timedelta(days=1)).fillna(0)
+    crossing = (days > 0).to_numpy()
+    if not crossing.any():
+        return df
+
+    # one row per day the call touches
+    parts = days.to_numpy()[crossing].astype(int) + 1
+    rows = np.repeat(np.arange(len(df))[crossing], parts)
+    part = np.arange(len(rows)) - np.repeat(np.cumsum(parts) - parts, parts)
+    first = part == 0
+    last = part == np.repeat(parts, parts) - 1
+
+    call = df.iloc[rows].copy()
+    day = (start_day.iloc[rows].reset_index(drop=True) +
+           pd.to_timedelta(part, unit='D'))
+    day_start = _localize(day, timezone)
+    day_end = _localize(day + pd.Timedelta(hours=23, minutes=59, seconds=59),
+                        timezone)
+    starttime = start.iloc[rows].reset_index(drop=True).where(first, day_start)
+    endtime = end.iloc[rows].reset_index(drop=True).where(last, day_end)
+
+    call['Start Time'] = starttime.array
+    call['End Time'] = endtime.array
+    duration = (endtime - starttime).dt.total_seconds()
+    call['Duration'] = np.floor(duration).to_numpy()
+    call['Weekday'] = starttime.dt.weekday.astype(float).to_numpy()
+    call['Caller'] = call['Caller'].where(first)
+    call['Terminator'] = call['Terminator'].where(last)
+    call['ID'] = np.nan
+
+    return pd.concat([df[~crossing], call])
+
+
+def _localize(times, timezone):
+    """wall clock times in the timezone of interest to timezone aware times"""
+    return times.dt.tz_localize(timezone,
+                                ambiguous=np.ones(len(times), dtype=bool),
+                                nonexistent='shift_forward')
@@ -0,0 +1,99 @@
+"""Sizes and durations of the Dash callback requests
+
+Every request to a callback is logged as one json line and added to
+totals per callback id (the output string Dash sends along). The totals
+are kept in the counters of backend.cache, so that all workers of a
+machine add to the same numbers.
+
+A callback whose request or response exceeds CALLBACK_BYTE_BUDGET bytes
+is logged as a warning, or fails the request when testing. The budget
+catches large data ending up in callback state again.
+"""
+import logging
+import os
+
+import orjson
+
+from backend import cache
+
+CALLBACK_BYTE_BUDGET = int(os.environ.get('CALLBACK_BYTE_BUDGET', 0))
+PREFIX = 'callback:'
+
+logger = logging.getLogger(__name__)
+
+
+class BudgetExceeded(AssertionError):
+    """a callback moved more bytes than CALLBACK_BYTE_BUDGET"""
+
+
+def record(callback_id, request_bytes, response_bytes, duration):
+    """ logs a callback request and adds it to the totals of the callback
+
+    Arguments:
+        callback_id {str} -- output string of the callback
+        request_bytes {int} -- size of the request body
+        response_bytes {int} -- size of the response body
+        duration {float} -- seconds the server took to answer
+
+    Returns:
+        dict -- the logged entry
+    """
+    entry = {
+        'callback': callback_id,
+        'request_bytes': request_bytes,
+        'response_bytes': response_bytes,
+        'duration_ms': round(duration * 1000, 3),
+    }
+    logger.info(orjson.dumps(entry).decode())
+
+    counters = cache.counters()
+    key = PREFIX + callback_id
+    with counters.transact(retry=True):
+        totals = counters.get(key, {
+            'calls': 0,
+            'request_bytes': 0,
+            'response_bytes': 0,
+            'max_request_bytes': 0,
+            'max_response_bytes': 0,
+            'duration_ms': 0.0,
+            'max_duration_ms': 0.0,
+        })
+        totals['calls'] += 1
+        for field in ['request_bytes', 'response_bytes', 'duration_ms']:
+            totals[field] += entry[field]
+            totals[f"max_{field}"] = max(totals[f"max_{field}"],
+                                         entry[field])
+        counters.set(key, totals, retry=True)
+    return entry
+
+
+def check_budget(entry, budget=None, strict=False):
+    """ compares the bytes of a callback request with the budget
+
+    Arguments:
+        entry {dict} -- entry returned by record
+        budget {int} -- bytes a request or response may have,
+                        CALLBACK_BYTE_BUDGET by default, 0 disables the check
+        strict {bool} -- raise BudgetExceeded instead of logging a warning
+
+    Returns:
+        bool -- whether the request kept to the budget
+    """
+    if budget is None:
+        budget = CALLBACK_BYTE_BUDGET
+    size = max(entry['request_bytes'], entry['response_bytes'])
+    if not budget or size <= budget:
+        return True
+    message = (f"callback {entry['callback']} moved {size} bytes, "
+               f"the budget is {budget}")
+    if strict:
+        raise BudgetExceeded(message)
+    logger.warning(message)
+    return False
+
+
+def stats():
+    """totals of every callback by callback id"""
+    counters = cache.counters()
+    return {key[len(PREFIX):]: counters.get(key)
+            for key in counters.iterkeys() if key.startswith(PREFIX)}
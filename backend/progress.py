@@ -0,0 +1,59 @@
+"""Rate limited progress reporting for background callbacks
+
+Every set_progress call of a background callback is a write to the
+callback manager's cache (diskcache or redis), while the page only polls
+every 500 ms. Updates are therefore limited to a few per second.
+"""
+import time
+
+STAGES = {
+    'parse': "Reading messages",
+    'extract': "Extracting calls",
+    'reconcile': "Matching calls",
+    'plot': "Drawing plots",
+}
+
+
+class ProgressReporter:
+    """ wraps set_progress of a background callback
+
+    Arguments:
+        set_progress {callable} -- takes (value, max, label)
+        updates_per_second {float} -- upper bound of forwarded updates
+        clock {callable} -- monotonic time in seconds
+    """
+
+    def __init__(self, set_progress, updates_per_second=2,
+                 clock=time.monotonic):
+        self.set_progress = set_progress
+        self.interval = 1 / updates_per_second
+        self.clock = clock
+        self.stage_name = None
+        self.total = 1
+        self.emitted = 0
+        self._last = float('-inf')
+
+    def stage(self, name, total=1):
+        """starts a stage of the pipeline, always reported"""
+        self.stage_name = name
+        self.total = max(total, 1)
+        self._emit(0)
+
+    def advance(self, done):
+        """reports done out of total for the current stage if due"""
+        if self.clock() - self._last >= self.interval:
+            self._emit(done)
+
+    def _emit(self, done):
+        self._last = self.clock()
+        self.emitted += 1
+        label = STAGES.get(self.stage_name, self.stage_name)
+        self.set_progress((str(done), str(self.total),
+                           f"{label} ({done}/{self.total})"))
+
+
+def as_reporter(set_progress):
+    """wraps a plain set_progress callable in a ProgressReporter"""
+    if isinstance(set_progress, ProgressReporter):
+        return set_progress
+    return ProgressReporter(set_progress)
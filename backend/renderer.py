@@ -0,0 +1,389 @@
+"""Pool of warm image renderers
+
+Every process that calls fig.to_image starts its own kaleido renderer (a
+headless Chromium) on first use. Renders are sent to a bounded pool of
+long-lived processes instead, which keep their renderer running. Each
+process is replaced after RENDERER_MAX_RENDERS renders to cap the memory
+a renderer accumulates, and a pool that stops answering is restarted. The
+render server checks its idle pool every HEALTH_CHECK_INTERVAL seconds.
+
+Background callbacks run in short-lived processes, so the pool is owned by
+a render server, `python -m backend.renderer`, that they connect to on
+RENDERER_ADDRESS. The server renders every figure once at a time and
+stores the image in the result cache of backend.cache.
+"""
+import atexit
+import itertools
+import logging
+import multiprocessing
+import os
+import queue
+import secrets
+import signal
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing.connection import AuthenticationError, Client, Listener
+
+import plotly.graph_objects as go
+import plotly.io as pio
+
+RENDERER_PROCESSES = int(os.environ.get('RENDERER_PROCESSES', 1))
+RENDERER_MAX_RENDERS = int(os.environ.get('RENDERER_MAX_RENDERS', 100))
+RENDERER_ADDRESS = os.environ.get('RENDERER_ADDRESS',
+                                  os.path.join('cache', 'renderer.sock'))
+RENDER_TIMEOUT = 120
+HEALTH_CHECK_INTERVAL = 60
+HEALTH_CHECK_TIMEOUT = 30
+# priorities of the render server, lower first
+DOWNLOAD = 0
+PRERENDER = 1
+
+logger = logging.getLogger(__name__)
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+class RendererPool:
+    """ bounded pool of processes that render figures to png
+
+    Arguments:
+        processes {int} -- number of renderer processes
+        max_renders {int} -- renders after which a process is replaced
+        timeout {float} -- seconds a render may take
+    """
+
+    def __init__(self, processes=RENDERER_PROCESSES,
+                 max_renders=RENDERER_MAX_RENDERS, timeout=RENDER_TIMEOUT):
+        self.processes = processes
+        self.max_renders = max_renders
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._executor = None
+        self._checked = time.monotonic()
+
+    def render(self, figure_json, scale):
+        """ renders a figure in one of the pool's processes
+
+        Arguments:
+            figure_json {bytes} -- plotly json of the figure
+            scale {float} -- scale of the image
+
+        Returns:
+            bytes -- the png image
+        """
+        if time.monotonic() - self._checked > HEALTH_CHECK_INTERVAL:
+            self.check()
+        try:
+            return self._submit(_render, figure_json, scale).result(
+                timeout=self.timeout)
+        except (BrokenProcessPool, FutureTimeoutError):
+            # a renderer crashed or hangs, the render is tried once more
+            self.restart()
+            return self._submit(_render, figure_json, scale).result(
+                timeout=self.timeout)
+
+    def check(self):
+        """ renders a tiny figure and restarts the pool if that fails
+
+        Returns:
+            bool -- whether the pool was healthy
+        """
+        self._checked = time.monotonic()
+        try:
+            self._submit(_ping).result(timeout=HEALTH_CHECK_TIMEOUT)
+            return True
+        except (BrokenProcessPool, FutureTimeoutError):
+            self.restart()
+            # the replacement starts its renderer before it is needed
+            self._submit(_ping)
+            return False
+
+    def restart(self):
+        """replaces all renderer processes"""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            _terminate(executor)
+
+    def shutdown(self):
+        self.restart()
+
+    def _submit(self, fn, *args):
+        with self._lock:
+            if self._executor is None:
+                # kaleido's renderer does not survive a fork
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.processes,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=_ping,
+                    max_tasks_per_child=self.max_renders)
+            return self._executor.submit(fn, *args)
+
+
+class RendererServer:
+    """ renders figures for the processes connected to it
+
+    Renders wait in a queue that the render threads, one per renderer
+    process, take the most urgent render from: downloads come before
+    pre-renders, otherwise first come first served.
+
+    Arguments:
+        pool {RendererPool} -- renders the figures
+        results {diskcache.Cache} -- stores the images by key
+        expire {int} -- seconds an image is kept
+    """
+
+    def __init__(self, pool, results, expire=None):
+        self.pool = pool
+        self.results = results
+        self.expire = expire
+        self._lock = threading.Lock()
+        # future and most urgent priority of every queued or running render
+        self._renders = {}
+        self._running = set()
+        self._queue = queue.PriorityQueue()
+        self._order = itertools.count()
+        for _ in range(pool.processes):
+            threading.Thread(target=self._work, daemon=True).start()
+
+    def render(self, key, figure_json, scale, priority=DOWNLOAD):
+        """ queues a figure unless it is stored or in flight
+
+        Arguments:
+            key {str} -- key of the image in the results
+            figure_json {bytes} -- plotly json of the figure
+            scale {float} -- scale of the image
+            priority {int} -- DOWNLOAD or PRERENDER
+
+        Returns:
+            concurrent.futures.Future -- resolves to the png image
+        """
+        with self._lock:
+            if key in self._renders:
+                future, queued = self._renders[key]
+                if priority >= queued or key in self._running:
+                    return future
+            else:
+                png = self.results.get(key)
+                if png is not None:
+                    future = Future()
+                    future.set_result(png)
+                    return future
+                future = Future()
+            # a download moves a queued pre-render of its figure ahead
+            self._renders[key] = future, priority
+            self._queue.put((priority, next(self._order), key, figure_json,
+                             scale))
+            return future
+
+    def check(self):
+        """ checks the pool unless it is rendering
+
+        Returns:
+            bool -- whether the pool was healthy or busy
+        """
+        with self._lock:
+            if self._renders:
+                # a check waiting behind a long render would time out
+                return True
+        return self.pool.check()
+
+    def serve(self, listener):
+        """answers the connections of a listener, one thread each"""
+        while True:
+            try:
+                connection = listener.accept()
+            except AuthenticationError:
+                continue
+            except OSError:
+                # the listener was closed
+                return
+            threading.Thread(target=self._handle, args=(connection,),
+                             daemon=True).start()
+
+    def _work(self):
+        while True:
+            _, _, key, figure_json, scale = self._queue.get()
+            with self._lock:
+                if key not in self._renders or key in self._running:
+                    # queued again with a higher priority
+                    continue
+                self._running.add(key)
+                future = self._renders[key][0]
+            try:
+                png = self.pool.render(figure_json, scale)
+                self.results.set(key, png, expire=self.expire, retry=True)
+            except Exception as error:
+                # nobody waits for a pre-render
+                logger.exception("Rendering %s failed", key)
+                future.set_exception(error)
+            else:
+                future.set_result(png)
+            finally:
+                # stored before it is no longer in flight
+                with self._lock:
+                    del self._renders[key]
+                    self._running.discard(key)
+
+    def _handle(self, connection):
+        with connection:
+            while True:
+                try:
+                    key, figure_json, scale, wait = connection.recv()
+                except EOFError:
+                    return
+                future = self.render(key, figure_json, scale,
+                                     DOWNLOAD if wait else PRERENDER)
+                if not wait:
+                    connection.send(('ok', None))
+                    continue
+                try:
+                    reply = ('ok', future.result())
+                except Exception as error:
+                    reply = ('error', repr(error))
+                connection.send(reply)
+
+
+def render(key, figure_json, scale, wait=True):
+    """ renders a figure in the render server
+
+    Arguments:
+        key {str} -- key of the image in the result cache
+        figure_json {bytes} -- plotly json of the figure
+        scale {float} -- scale of the image
+        wait {bool} -- wait for the image, otherwise the server renders it
+                       after answering
+
+    Returns:
+        bytes -- the png image, stored under key, or None if not waiting
+
+    Raises:
+        ConnectionError -- if no render server is running
+    """
+    with _connect() as connection:
+        connection.send((key, figure_json, scale, wait))
+        # a render is tried twice by the pool
+        if not connection.poll(2 * RENDER_TIMEOUT + HEALTH_CHECK_TIMEOUT):
+            raise TimeoutError("The render server does not answer.")
+        try:
+            status, value = connection.recv()
+        except EOFError as error:
+            raise ConnectionResetError("The render server exited.") from error
+    if status != 'ok':
+        raise RuntimeError(f"Rendering failed: {value}")
+    return value
+
+
+def start_server(timeout=60):
+    """ starts the render server in a process of its own
+
+    Processes forked afterwards find it through RENDERER_ADDRESS and
+    RENDERER_AUTHKEY. Nothing is started if a server answers already.
+
+    Arguments:
+        timeout {float} -- seconds to wait for the server to answer
+
+    Returns:
+        subprocess.Popen -- the server process or None
+    """
+    os.environ.setdefault('RENDERER_AUTHKEY', secrets.token_hex(16))
+    if _answers():
+        return None
+    process = subprocess.Popen([sys.executable, '-m', 'backend.renderer'])
+    atexit.register(process.terminate)
+    deadline = time.monotonic() + timeout
+    while not _answers():
+        if process.poll() is not None or time.monotonic() > deadline:
+            raise RuntimeError("The render server did not start.")
+        time.sleep(0.1)
+    return process
+
+
+def main():
+    """runs the render server until the process that started it exits"""
+    # pandas and the caches are only needed by the server
+    from backend import cache
+
+    parent = os.getppid()
+    server = RendererServer(RendererPool(), cache.results(),
+                            expire=cache.RESULT_TIMEOUT)
+    os.makedirs(os.path.dirname(RENDERER_ADDRESS) or '.', exist_ok=True)
+    if os.path.exists(RENDERER_ADDRESS):
+        # left behind by a server that was killed
+        os.remove(RENDERER_ADDRESS)
+    listener = Listener(RENDERER_ADDRESS, family='AF_UNIX',
+                        authkey=os.environ['RENDERER_AUTHKEY'].encode())
+    threading.Thread(target=server.serve, args=(listener,),
+                     daemon=True).start()
+    # terminating the server stops its renderer processes as well
+    signal.signal(signal.SIGTERM, lambda *args: sys.exit(0))
+    try:
+        server.check()
+        checked = time.monotonic()
+        while os.getppid() == parent:
+            time.sleep(1)
+            if time.monotonic() - checked > HEALTH_CHECK_INTERVAL:
+                # a renderer that died while idle is replaced before the
+                # next download needs it
+                server.check()
+                checked = time.monotonic()
+    finally:
+        server.pool.shutdown()
+        listener.close()
+
+
+def pool():
+    """the renderer pool of this process, started on first use"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = RendererPool()
+        return _pool
+
+
+def _connect():
+    authkey = os.environ.get('RENDERER_AUTHKEY')
+    if authkey is None:
+        raise ConnectionRefusedError("No render server was started.")
+    try:
+        return Client(RENDERER_ADDRESS, family='AF_UNIX',
+                      authkey=authkey.encode())
+    except (FileNotFoundError, AuthenticationError) as error:
+        raise ConnectionRefusedError("No render server is running.") from error
+
+
+def _answers():
+    try:
+        _connect().close()
+        return True
+    except ConnectionError:
+        return False
+
+
+def _terminate(executor):
+    # shutdown alone waits for a hanging render
+    processes = list((executor._processes or {}).values())
+    executor.shutdown(wait=False, cancel_futures=True)
+    for process in processes:
+        process.terminate()
+
+
+def _render(figure_json, scale):
+    return pio.from_json(figure_json).to_image(format="png", scale=scale)
+
+
+def _ping():
+    """starts the renderer of a new process with a tiny figure"""
+    go.Figure().to_image(format="png", width=10, height=10)
+
+
+if __name__ == '__main__':
+    # the pool pickles functions by module name, not as __main__
+    from backend import renderer
+    renderer.main()
@@ -0,0 +1,85 @@
+"""Analysis results kept on the server for the browser
+
+The browser only stores the key of a session. The figures of the
+analysis are created by a background worker and served by the web
+processes, so they are kept in backend.shared. A session expires
+SESSION_TIMEOUT seconds after it was last read.
+"""
+import os
+import secrets
+
+import orjson
+
+from backend import shared
+
+SESSION_TIMEOUT = int(os.environ.get('SESSION_TIMEOUT', 24 * 3600))
+
+
+def create(figures):
+    """ stores the figures of an analysis in a new session
+
+    Arguments:
+        figures {dict} -- plotly json of the figures by plot id
+
+    Returns:
+        str -- key of the session
+    """
+    key = secrets.token_urlsafe(16)
+    for plot_id, figure in figures.items():
+        shared.put(_figure_key(key, plot_id), orjson.dumps(figure),
+                   SESSION_TIMEOUT)
+    # written last, the session is complete once it can be found
+    shared.put(_session_key(key), orjson.dumps(list(figures)),
+               SESSION_TIMEOUT)
+    return key
+
+
+def plot_ids(key):
+    """ids of the figures of a session or None if it expired"""
+    if key is None:
+        return None
+    ids = shared.get(_session_key(key), expire=SESSION_TIMEOUT)
+    return orjson.loads(ids) if ids is not None else None
+
+
+def load_figure_json(key, plot_id):
+    """like load_figure without decoding the figure"""
+    return shared.get(_figure_key(key, plot_id), expire=SESSION_TIMEOUT)
+
+
+def load_figure(key, plot_id):
+    """ reads one figure of a session
+
+    Arguments:
+        key {str} -- key of the session
+        plot_id {str} -- id of the plot, e.g. 'calendar-plot'
+
+    Returns:
+        dict -- plotly json of the figure or None if it expired
+    """
+    figure = load_figure_json(key, plot_id)
+    return orjson.loads(figure) if figure is not None else None
+
+
+def load_figures(key):
+    """ reads all figures of a session
+
+    Returns:
+        dict -- plotly json of the figures by plot id or None if the
+                session or one of its figures expired
+    """
+    ids = plot_ids(key)
+    if ids is None:
+        return None
+    figures = {plot_id: load_figure(key, plot_id) for plot_id in ids}
+    if any(figure is None for figure in figures.values()):
+        return None
+    return figures
+
+
+def _session_key(key):
+    return f"session:{key}"
+
+
+def _figure_key(key, plot_id):
+    return f"figure:{key}:{plot_id}"
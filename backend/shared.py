@@ -0,0 +1,146 @@
+"""Storage shared by the web processes and the background workers
+
+With REDIS_URL set the background callbacks run on a Celery worker that
+does not share a disk with the web processes, entries are then kept in
+Redis. Every entry expires, the Redis server should evict with
+maxmemory-policy volatile-lru, so that entries are evicted least recently
+used first and the keys of the Celery broker, which do not expire, stay.
+
+Without REDIS_URL everything runs on one machine and the entries are kept
+in a diskcache bounded to SHARED_CACHE_SIZE bytes with least-recently-used
+eviction.
+
+Values are split into chunks of CHUNK_SIZE bytes, so that large values are
+streamed instead of held in memory at once.
+"""
+import os
+
+import diskcache
+
+SHARED_CACHE_DIR = os.environ.get('SHARED_CACHE_DIR',
+                                  os.path.join('cache', 'shared'))
+SHARED_CACHE_SIZE = int(os.environ.get('SHARED_CACHE_SIZE', 256 * 2**20))
+CHUNK_SIZE = 4 * 2**20
+REDIS_PREFIX = 'skypewaddle:'
+
+_backend = None
+
+
+def remote():
+    """whether the storage is reachable from other machines"""
+    return 'REDIS_URL' in os.environ
+
+
+def backend():
+    """the Redis or diskcache backend, connected on first use"""
+    global _backend
+    if _backend is None:
+        if remote():
+            _backend = _RedisBackend(os.environ['REDIS_URL'])
+        else:
+            _backend = _DiskBackend(diskcache.Cache(
+                SHARED_CACHE_DIR, size_limit=SHARED_CACHE_SIZE,
+                eviction_policy='least-recently-used'))
+    return _backend
+
+
+def put(key, data, expire):
+    """ stores bytes under key
+
+    Arguments:
+        key {str} -- key of the entry
+        data {bytes} -- value of the entry
+        expire {int} -- seconds until the entry expires
+    """
+    _put_chunks(key, (data[i:i + CHUNK_SIZE]
+                      for i in range(0, len(data), CHUNK_SIZE)), expire)
+
+
+def put_file(key, path, expire):
+    """like put for the content of a file, which is read in chunks"""
+    with open(path, 'rb') as f:
+        _put_chunks(key, iter(lambda: f.read(CHUNK_SIZE), b''), expire)
+
+
+def get(key, expire=None):
+    """ reads the bytes stored under key
+
+    Arguments:
+        key {str} -- key of the entry
+        expire {int} -- seconds the entry is kept from now on, unchanged
+                        by default
+
+    Returns:
+        bytes -- value of the entry or None if it expired
+    """
+    chunks = []
+    if not _read_chunks(key, chunks.append, expire):
+        return None
+    return b''.join(chunks)
+
+
+def get_file(key, f):
+    """ writes the bytes stored under key to a file chunk by chunk
+
+    Arguments:
+        key {str} -- key of the entry
+        f {file} -- file opened for writing bytes
+
+    Returns:
+        bool -- whether the entry was found
+    """
+    return _read_chunks(key, f.write)
+
+
+def _put_chunks(key, chunks, expire):
+    # the chunk count is written last, readers never see a partial entry
+    count = 0
+    for count, chunk in enumerate(chunks, 1):
+        backend().set(f"{key}:{count - 1}", chunk, expire)
+    backend().set(key, str(count).encode(), expire)
+
+
+def _read_chunks(key, write, expire=None):
+    count = backend().get(key)
+    if count is None:
+        return False
+    names = [key] + [f"{key}:{i}" for i in range(int(count))]
+    for name in names[1:]:
+        chunk = backend().get(name)
+        if chunk is None:
+            # evicted
+            return False
+        write(chunk)
+    if expire is not None:
+        for name in names:
+            backend().touch(name, expire)
+    return True
+
+
+class _DiskBackend:
+    def __init__(self, cache):
+        self.cache = cache
+
+    def set(self, name, value, expire):
+        self.cache.set(name, value, expire=expire, retry=True)
+
+    def get(self, name):
+        return self.cache.get(name, retry=True)
+
+    def touch(self, name, expire):
+        self.cache.touch(name, expire=expire, retry=True)
+
+
+class _RedisBackend:
+    def __init__(self, url):
+        import redis
+        self.client = redis.Redis.from_url(url)
+
+    def set(self, name, value, expire):
+        self.client.set(REDIS_PREFIX + name, value, ex=expire)
+
+    def get(self, name):
+        return self.client.get(REDIS_PREFIX + name)
+
+    def touch(self, name, expire):
+        self.client.expire(REDIS_PREFIX + name, expire)
@@ -0,0 +1,301 @@
+"""On-disk cache of uploaded exports
+
+Every export is stored once under its content hash together with an index
+of the byte spans of its conversations. Later reads seek to the span of
+the selected conversation instead of decoding the whole messages.json.
+The extracted calls of a conversation are stored next to the export as a
+CallTable that every worker can memory-map.
+"""
+import hashlib
+import mmap
+import os
+import re
+import shutil
+import tempfile
+from urllib.parse import quote
+
+import orjson
+
+from backend import stream
+
+EXPORT_DIR = os.environ.get('EXPORT_CACHE_DIR',
+                            os.path.join('cache', 'exports'))
+INDEX_VERSION = 1
+# partner id of the calls with all conversation partners, see backend.batch
+EVERYONE = '*'
+_KEY = re.compile(r'[0-9a-f]{64}')
+
+
+def export_key(data):
+    """content hash identifying an export"""
+    return hashlib.sha256(data).hexdigest()
+
+
+def export_path(key, name='messages.json'):
+    # keys come from the browser, they must not leave EXPORT_DIR
+    if not is_key(key):
+        raise ValueError("Unknown export.")
+    return os.path.join(EXPORT_DIR, key, name)
+
+
+def is_key(key):
+    """whether key has the form of an export_key"""
+    return isinstance(key, str) and _KEY.fullmatch(key) is not None
+
+
+def has_export(key):
+    return is_key(key) and os.path.exists(export_path(key))
+
+
+def save_export_file(path, key):
+    """ moves a messages.json written to disk into the store
+
+    Arguments:
+        path {str} -- file holding the content of messages.json
+        key {str} -- export_key of the content
+
+    Returns:
+        str -- key of the stored export
+    """
+    if os.path.exists(export_path(key)):
+        os.remove(path)
+    else:
+        # a malformed export raises before it is stored
+        conversations = _index_file(path)
+        os.makedirs(os.path.dirname(export_path(key)), exist_ok=True)
+        shutil.move(path, export_path(key))
+        _write_index(key, conversations)
+    if not os.path.exists(export_path(key, 'index.json')):
+        _write_index(key, _index_file(export_path(key)))
+    _touch(key)
+    return key
+
+
+def temporary_path(suffix='.tmp'):
+    """an empty file next to the stored exports, moving it into the store
+    with save_export_file is a rename"""
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+    fd, path = tempfile.mkstemp(suffix=suffix, dir=EXPORT_DIR)
+    os.close(fd)
+    return path
+
+
+def load_index(key):
+    """ reads the conversation index of a stored export
+
+    The index is rebuilt from messages.json if it is missing or outdated.
+
+    Arguments:
+        key {str} -- key of the stored export
+
+    Returns:
+        list -- {'header': conversation without MessageList,
+                 'span': [start, end] of the MessageList or None}
+    """
+    try:
+        with open(export_path(key, 'index.json'), 'rb') as f:
+            index = orjson.loads(f.read())
+        if index['version'] == INDEX_VERSION:
+            return index['conversations']
+    except (FileNotFoundError, orjson.JSONDecodeError, KeyError):
+        pass
+
+    return _write_index(key, _index_file(export_path(key)))
+
+
+def read_conversation_headers(key):
+    """ reads the conversations of a stored export without their messages
+
+    Returns:
+        list -- skype structure ['conversations'] without the MessageLists
+                or None if there are no conversations in the file
+    """
+    headers = [entry['header'] for entry in load_index(key)]
+    return headers if headers else None
+
+
+def read_message_list(key, partner_index):
+    """ decodes the MessageList of a single conversation of a stored export
+
+    Arguments:
+        key {str} -- key of the stored export
+        partner_index {int} -- index of the conversation
+
+    Returns:
+        list -- skype structure ['conversations'][partner_index]['MessageList']
+    """
+    span = load_index(key)[partner_index]['span']
+    if span is None:
+        raise ValueError("The json file is malformed.")
+
+    start, end = span
+    _touch(key)
+    with open(export_path(key), 'rb') as f:
+        f.seek(start)
+        return orjson.loads(f.read(end - start))
+
+
+def extract_conversations(conversations):
+    """
+    Extracts all conversation partners from file and lets user choose one.
+
+    Arguments:
+        path {str} -- path to json file from skype structure ['conversations']
+        teset {bool} -- if True, then function returns before user input
+
+    Returns:
+        option -- the conversation partner picked or if test list of all conversation partners
+        indexes -- index of the chosen partner or if test a dictionary with all conversation partner as key and their index as value
+    """
+
+    participants = []
+    for i in range(0, len(conversations)):
+        userid = conversations[i]['id']
+        if not userid.endswith('.skype'):
+            partner = conversations[i]['displayName'] if conversations[i]['displayName'] \
+                is not None and userid.startswith('8:') else userid
+            participants.append({'label': partner, 'username': userid})
+    return participants
+
+
+def calls_path(key, partner_id):
+    name = quote(partner_id, safe='')
+    if name in ('', '.', '..'):
+        raise ValueError("Unknown conversation partner.")
+    return export_path(key, os.path.join('calls', name))
+
+
+def save_calls(key, partner_id, table, watermark):
+    """ stores the calls of a conversation of a stored export
+
+    Arguments:
+        key {str} -- key of the stored export
+        partner_id {str} -- id of the conversation partner
+        table {CallTable} -- calls of the conversation in UTC
+        watermark {tuple} -- extract.get_watermark of the conversation
+    """
+    path = calls_path(key, partner_id)
+    if os.path.exists(path):
+        return
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    os.makedirs(tmp_path, exist_ok=True)
+    table.save(tmp_path)
+    with open(os.path.join(tmp_path, 'watermark.json'), 'wb') as f:
+        f.write(orjson.dumps(watermark))
+    try:
+        os.rename(tmp_path, path)
+    except OSError:
+        # stored by another worker in the meantime
+        shutil.rmtree(tmp_path, ignore_errors=True)
+    _touch(key)
+
+
+def load_calls(key, partner_id):
+    """ maps the stored calls of a conversation into memory
+
+    Arguments:
+        key {str} -- key of the stored export
+        partner_id {str} -- id of the conversation partner
+
+    Returns:
+        tuple -- CallTable and watermark or None if they are not stored
+    """
+    # pandas is only needed once calls are read
+    from backend.calltable import CallTable
+
+    path = calls_path(key, partner_id)
+    try:
+        table = CallTable.load(path)
+        with open(os.path.join(path, 'watermark.json'), 'rb') as f:
+            watermark = orjson.loads(f.read())
+    except FileNotFoundError:
+        return None
+    _touch(key)
+    return table, tuple(watermark) if watermark is not None else None
+
+
+def exports_size():
+    """bytes used by all stored exports"""
+    return sum(size for _, _, size in _list_exports())
+
+
+def evict_exports(size_limit, keep=None):
+    """ removes the least recently used exports beyond size_limit bytes
+
+    Arguments:
+        size_limit {int} -- bytes the stored exports may use
+        keep {str} -- key of an export that is never removed
+    """
+    exports = sorted(_list_exports(), key=lambda export: export[1])
+    total = sum(size for _, _, size in exports)
+    for key, _, size in exports:
+        if total <= size_limit:
+            break
+        if key == keep:
+            continue
+        shutil.rmtree(os.path.join(EXPORT_DIR, key), ignore_errors=True)
+        total -= size
+
+
+def _list_exports():
+    """key, last use and size of every stored export"""
+    exports = []
+    if not os.path.isdir(EXPORT_DIR):
+        return exports
+    for entry in os.scandir(EXPORT_DIR):
+        if not entry.is_dir():
+            continue
+        try:
+            exports.append((entry.name, entry.stat().st_mtime,
+                            _directory_size(entry.path)))
+        except FileNotFoundError:
+            # removed by another worker in the meantime
+            continue
+    return exports
+
+
+def _directory_size(path):
+    return sum(os.path.getsize(os.path.join(root, name))
+               for root, _, names in os.walk(path) for name in names)
+
+
+def _touch(key):
+    """marks an export as recently used"""
+    try:
+        os.utime(os.path.join(EXPORT_DIR, key))
+    except FileNotFoundError:
+        pass
+
+
+def _index_file(path):
+    """indexes a messages.json without reading it into memory"""
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            raise ValueError("The json file is malformed.")
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            return _index(data)
+
+
+def _index(data):
+    return [{
+        'header': header,
+        'span': span,
+    } for header, span in stream.iter_conversations(data)]
+
+
+def _write_index(key, conversations):
+    _write_atomic(export_path(key, 'index.json'), orjson.dumps({
+        'version': INDEX_VERSION,
+        'conversations': conversations,
+    }))
+    return conversations
+
+
+def _write_atomic(path, data):
+    """writes to a temporary file first so that concurrent workers never
+    read a partially written file"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
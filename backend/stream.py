@@ -0,0 +1,158 @@
+"""Incremental reading of the skype messages.json
+
+The export is scanned without decoding it. Only the conversation headers
+and the MessageList of the selected conversation are handed to orjson.
+"""
+import re
+
+import orjson
+
+# everything up to the next bracket that is not part of a string
+_SKIP = re.compile(rb'[^"\[\]{}]*+(?:"[^"\\]*+(?:\\.[^"\\]*+)*+"[^"\[\]{}]*+)*+',
+                   re.DOTALL)
+_STRING = re.compile(rb'"[^"\\]*+(?:\\.[^"\\]*+)*+"', re.DOTALL)
+_SCALAR = re.compile(rb'[^,:\[\]{}\s]++')
+_WHITESPACE = re.compile(rb'\s*+')
+
+
+def iter_conversations(data):
+    """ yields the conversations of an export without their messages
+
+    Arguments:
+        data {bytes} -- content of messages.json (bytes or mmap)
+
+    Yields:
+        tuple -- conversation header (dict without 'MessageList') and the
+                 (start, end) byte span of its MessageList or None
+    """
+    pos, _ = _first(data, _skip_whitespace(data, 0), b'{', b'}')
+    while pos is not None:
+        key, start = _read_key(data, pos)
+        if key == 'conversations':
+            if data[start:start + 1] != b'[':
+                return
+            pos, _ = _first(data, start, b'[', b']')
+            while pos is not None:
+                header, span, end = _read_conversation(data, pos)
+                yield header, span
+                pos, _ = _next(data, end, b']')
+            return
+        pos, _ = _next(data, _value_end(data, start), b'}')
+
+
+def read_conversation_headers(data):
+    """ reads id, displayName, etc. of every conversation
+
+    Arguments:
+        data {bytes} -- content of messages.json
+
+    Returns:
+        list -- skype structure ['conversations'] without the MessageLists
+                or None if there are no conversations in the file
+    """
+    headers = [header for header, _ in iter_conversations(data)]
+    return headers if headers else None
+
+
+def read_message_list(data, partner_index):
+    """ decodes the MessageList of a single conversation
+
+    Arguments:
+        data {bytes} -- content of messages.json
+        partner_index {int} -- index of the conversation
+
+    Returns:
+        list -- skype structure ['conversations'][partner_index]['MessageList']
+    """
+    for i, (_, span) in enumerate(iter_conversations(data)):
+        if i == partner_index:
+            if span is None:
+                raise ValueError("The json file is malformed.")
+            return orjson.loads(data[span[0]:span[1]])
+    raise IndexError(f"There is no conversation {partner_index}.")
+
+
+def _read_conversation(data, start):
+    """decodes a conversation object, skipping over its MessageList"""
+    span = None
+    pos, end = _first(data, start, b'{', b'}')
+    while pos is not None:
+        key, value_start = _read_key(data, pos)
+        value_end = _value_end(data, value_start)
+        if key == 'MessageList':
+            span = (value_start, value_end)
+        pos, end = _next(data, value_end, b'}')
+
+    if span is None:
+        return orjson.loads(data[start:end]), None, end
+    header = orjson.loads(data[start:span[0]] + b'null' + data[span[1]:end])
+    del header['MessageList']
+    return header, span, end
+
+
+def _first(data, pos, opening, closing):
+    """returns the start of the first item in the container at pos or
+    None and the index after the container if it is empty"""
+    if data[pos:pos + 1] != opening:
+        raise ValueError("The json file is malformed.")
+    pos = _skip_whitespace(data, pos + 1)
+    if data[pos:pos + 1] == closing:
+        return None, pos + 1
+    return pos, None
+
+
+def _next(data, pos, closing):
+    """returns the start of the item after the value ending at pos or
+    None and the index after the container if it was the last one"""
+    pos = _skip_whitespace(data, pos)
+    separator = data[pos:pos + 1]
+    if separator == closing:
+        return None, pos + 1
+    if separator != b',':
+        raise ValueError("The json file is malformed.")
+    return _skip_whitespace(data, pos + 1), None
+
+
+def _read_key(data, pos):
+    """returns the key of the member at pos and the start of its value"""
+    match = _STRING.match(data, pos)
+    if match is None:
+        raise ValueError("The json file is malformed.")
+    pos = _skip_whitespace(data, match.end())
+    if data[pos:pos + 1] != b':':
+        raise ValueError("The json file is malformed.")
+    return orjson.loads(match.group()), _skip_whitespace(data, pos + 1)
+
+
+def _value_end(data, pos):
+    """returns the index after the json value starting at pos"""
+    first = data[pos:pos + 1]
+    if first == b'"':
+        match = _STRING.match(data, pos)
+    elif first in (b'{', b'['):
+        return _container_end(data, pos)
+    else:
+        match = _SCALAR.match(data, pos)
+    if match is None:
+        raise ValueError("The json file is malformed.")
+    return match.end()
+
+
+def _container_end(data, pos):
+    """returns the index after the bracket matching the one at pos"""
+    depth = 0
+    while True:
+        bracket = data[pos:pos + 1]
+        if bracket in (b'{', b'['):
+            depth += 1
+        elif bracket in (b'}', b']'):
+            depth -= 1
+            if depth == 0:
+                return pos + 1
+        else:
+            raise ValueError("The json file is malformed.")
+        pos = _SKIP.match(data, pos + 1).end()
+
+
+def _skip_whitespace(data, pos):
+    return _WHITESPACE.match(data, pos).end()
@@ -1,35 +1,68 @@
-import base64
-import io
+import hashlib
+import os
 import tarfile
-from typing import IO, cast
 
-import dash_bootstrap_components as dbc
-import orjson
-from dash import dcc
-from plotly import graph_objects as go
+from backend import cache, store
 
+MAX_UPLOAD_SIZE = 100000000
+UPLOAD_CHUNK_SIZE = 2**20
 
-def read_conversations_from_file(contents, filename):
 
-    _, content_string = contents.split(',')
-    decoded_data = base64.b64decode(content_string)
+def save_upload(stream, filename):
+    """ writes an uploaded export to disk in chunks and stores its
+    messages.json in the export cache
 
-    if filename.endswith('.tar'):
-        buffer = io.BytesIO(decoded_data)
-        tar = tarfile.open(fileobj=buffer, mode="r")
+    Arguments:
+        stream {file} -- body of the upload request
+        filename {str} -- name of the uploaded .tar or .json file
 
-        file = next(filter(lambda tar_element: tar_element.name == "messages.json", list(tar.getmembers())))
-        decoded_data = cast(IO[bytes],tar.extractfile(file)).read()
-    elif not filename.endswith('.json'):
+    Returns:
+        str -- content hash of messages.json, the handle of the upload and
+               the key of all cache entries
+    """
+    if not filename.endswith(('.tar', '.json')):
         raise ValueError('File must be a .json or .tar file.')
 
-    data = orjson.loads(decoded_data)
-    return data['conversations'] if 'conversations' in data else None
+    paths = []
+    try:
+        paths.append(store.temporary_path('.upload'))
+        with open(paths[-1], 'wb') as upload:
+            digest = _copy(stream, upload, MAX_UPLOAD_SIZE)
 
-def make_tab(figure: go.Figure):
-    return dbc.Card(
-        dbc.CardBody([
-            dcc.Graph(figure=figure),
-        ]),
-        className="multi-tab",
-    )
\ No newline at end of file
+        if filename.endswith('.tar'):
+            paths.append(store.temporary_path('.upload'))
+            with open(paths[-1], 'wb') as messages:
+                digest = _extract_messages(paths[0], messages)
+
+        return cache.save_export_file(paths[-1], digest.hexdigest())
+    finally:
+        for path in paths:
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def _copy(source, target, limit=None):
+    """copies in chunks and returns the sha256 of the copied bytes"""
+    digest = hashlib.sha256()
+    size = 0
+    while chunk := source.read(UPLOAD_CHUNK_SIZE):
+        size += len(chunk)
+        if limit is not None and size > limit:
+            raise ValueError('File is too large.')
+        digest.update(chunk)
+        target.write(chunk)
+    return digest
+
+
+def _extract_messages(path, target):
+    try:
+        with tarfile.open(path, mode="r") as tar:
+            member = next(filter(
+                lambda tar_element: tar_element.name == "messages.json", tar),
+                None)
+            if member is None:
+                raise ValueError('The tar file does not contain messages.json.')
+            with tar.extractfile(member) as messages:
+                return _copy(messages, target)
+    except tarfile.TarError as error:
+        raise ValueError('The tar file is malformed.') from error
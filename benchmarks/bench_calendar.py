@@ -0,0 +1,49 @@
+"""Benchmark of the calendar heatmap against plotly_calplot
+
+Run with `python -m benchmarks.bench_calendar [n_calls]`.
+"""
+import sys
+import time
+
+import pandas as pd
+from plotly_calplot import calplot
+
+from backend import create, extract
+from benchmarks.synthetic import make_messages
+
+
+def calplot_figure(summary):
+    """calendar_plot as it was built with plotly_calplot"""
+    df = pd.DataFrame({
+        "ds": pd.date_range(summary['first_day'],
+                            periods=len(summary['daily'])),
+        "value": summary['daily'] / 3600,
+    })
+    return calplot(df, x="ds", y="value", name="Call Duration in Hours",
+                   gap=0, month_lines_width=3, month_lines_color="#eeeeff",
+                   colorscale="Teal", years_title=True)
+
+
+def measure(build, summary):
+    build(summary)
+    start = time.perf_counter()
+    fig = build(summary)
+    elapsed = time.perf_counter() - start
+    return elapsed, len(fig.to_json())
+
+
+def main(n_calls=7000):
+    df = extract.extract_calls(lambda progress: None, make_messages(n_calls),
+                               'Europe/Berlin')
+    summary = create.summarize(df)
+    years = len(summary['daily']) / 365.25
+
+    for name, build in [("plotly_calplot", calplot_figure),
+                        ("calendar_plot", create.calendar_plot)]:
+        elapsed, size = measure(build, summary)
+        print(f"{name}: {years:.1f} years in {elapsed * 1000:.0f}ms, "
+              f"{size / 1024:.0f} KiB of figure JSON")
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
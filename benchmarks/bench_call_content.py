@@ -0,0 +1,28 @@
+"""Micro-benchmark of the call event decoder on the events of TestData.json
+
+Run with `python -m benchmarks.bench_call_content [repeat]`.
+"""
+import sys
+import timeit
+
+import orjson
+
+from backend import extract
+
+
+def main(repeat=2000):
+    with open("./tests/test_data/TestData.json", "rb") as f:
+        conversations = orjson.loads(f.read())['conversations']
+    contents = [obj['content'] for conversation in conversations
+                for obj in conversation['MessageList'] if extract.is_call(obj)]
+
+    for name, parse in [('lxml', extract._parse_call_content_xml),
+                        ('parse_call_content', extract.parse_call_content)]:
+        elapsed = timeit.timeit(lambda: [parse(c) for c in contents],
+                                number=repeat)
+        per_event = elapsed / (repeat * len(contents)) * 1e6
+        print(f"{name}: {per_event:.2f} us per event")
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
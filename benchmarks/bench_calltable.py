@@ -0,0 +1,26 @@
+"""Memory used by the call dataframe compared to its CallTable
+
+Run with `python -m benchmarks.bench_calltable [n_calls]`.
+"""
+import pickle
+import sys
+
+from backend import extract
+from backend.calltable import CallTable, memory_report
+from benchmarks.synthetic import make_messages
+
+
+def main(n_calls=100000):
+    df = extract.extract_utc_calls(lambda progress: None,
+                                   make_messages(n_calls))
+    report = memory_report(df)
+
+    print(f"{report['rows']} calls: dataframe {report['frame_bytes'] / 2**20:.1f} MiB, "
+          f"CallTable {report['table_bytes'] / 2**20:.1f} MiB "
+          f"({report['ratio']:.1f}x smaller)")
+    print(f"pickled: dataframe {len(pickle.dumps(df)) / 2**20:.1f} MiB, "
+          f"CallTable {len(pickle.dumps(CallTable.from_frame(df))) / 2**20:.1f} MiB")
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,25 @@
+"""Benchmark of the call extraction
+
+Run with `python -m benchmarks.bench_extract [n_calls]`.
+"""
+import sys
+import time
+
+from backend import extract
+from benchmarks.synthetic import make_messages
+
+
+def main(n_calls=50000):
+    messages = make_messages(n_calls)
+    events = sum(extract.is_call(obj) for obj in messages)
+
+    start = time.perf_counter()
+    df = extract.extract_calls(lambda progress: None, messages, 'Europe/Berlin')
+    elapsed = time.perf_counter() - start
+
+    print(f"extract_calls: {events} call events -> {len(df)} rows "
+          f"in {elapsed:.2f}s")
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,65 @@
+"""Import time of app.py from an `-X importtime` profile
+
+Run with `python -m benchmarks.bench_import [budget_ms]`. Exits with 1 if
+the modules of this repository take longer than the budget to import or
+if a module the callbacks load lazily is imported with the app.
+"""
+import subprocess
+import sys
+
+BUDGET_MS = 150
+LAZY_MODULES = ['pandas', 'numpy', 'lxml', 'plotly.graph_objects',
+                'plotly.io', 'kaleido', 'backend.create', 'backend.export',
+                'backend.extract']
+
+
+def import_profile(module='app'):
+    """ imports a module in a fresh interpreter with -X importtime
+
+    Returns:
+        list -- (depth, name, self_us, cumulative_us) of every import
+    """
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f"import {module}"],
+        capture_output=True, text=True, check=True)
+    profile = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip())) // 2
+        profile.append((depth, name.strip(), int(self_us),
+                        int(cumulative_us)))
+    return profile
+
+
+def own_import_ms(profile, module='app'):
+    """milliseconds spent importing module and the backend and frontend
+    modules it imports directly"""
+    own = [cumulative for depth, name, _, cumulative in profile
+           if depth == 1 and name.split('.')[0] in ('backend', 'frontend')]
+    own += [self_us for depth, name, self_us, _ in profile
+            if depth == 0 and name == module]
+    return sum(own) / 1000
+
+
+def main(budget_ms=BUDGET_MS):
+    profile = import_profile()
+    total = next(cumulative for depth, name, _, cumulative in profile
+                 if depth == 0 and name == 'app') / 1000
+    own = own_import_ms(profile)
+    imported = {name for _, name, _, _ in profile}
+    eager = [module for module in LAZY_MODULES if module in imported]
+
+    print(f"import app: {total:.0f}ms, {own:.0f}ms of it in this repository "
+          f"(budget {budget_ms}ms)")
+    for depth, name, _, cumulative in sorted(
+            profile, key=lambda entry: -entry[3])[:10]:
+        print(f"  {cumulative / 1000:8.1f}ms  {name}")
+    if eager:
+        print(f"imported eagerly: {', '.join(eager)}")
+    return 0 if own <= budget_ms and not eager else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main(*map(int, sys.argv[1:])))
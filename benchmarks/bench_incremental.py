@@ -0,0 +1,48 @@
+"""Benchmark of extending a call table with a newer export
+
+Run with `python -m benchmarks.bench_incremental [n_calls]`. The earlier
+export holds the older 90% of the messages, 5% of the calls are never
+answered and stay incomplete. Extending should cost about as much as
+extracting the newest 10% on their own.
+"""
+import sys
+import time
+
+import pandas as pd
+
+from backend import extract
+from benchmarks.synthetic import make_messages
+
+
+def main(n_calls=30000):
+    messages = make_messages(n_calls, unanswered_share=0.05)
+    # newest message first
+    earlier = messages[len(messages) // 10:]
+    calls = extract.extract_utc_calls(lambda progress: None, earlier)
+    watermark = extract.get_watermark(earlier)
+    incomplete = int((calls['Start Time'].isna() |
+                      calls['End Time'].isna()).sum())
+
+    start = time.perf_counter()
+    full = extract.extract_utc_calls(lambda progress: None, messages)
+    full_elapsed = time.perf_counter() - start
+
+    start = time.perf_counter()
+    extract.extract_utc_calls(lambda progress: None,
+                              messages[:len(messages) // 10])
+    new_elapsed = time.perf_counter() - start
+
+    start = time.perf_counter()
+    extended = extract.extend_utc_calls(lambda progress: None, messages,
+                                        calls, watermark)
+    extend_elapsed = time.perf_counter() - start
+
+    pd.testing.assert_frame_equal(extended, full.sort_index())
+    print(f"{len(full)} calls, {incomplete} incomplete at the watermark: "
+          f"extract_utc_calls {full_elapsed:.2f}s, "
+          f"of the new messages {new_elapsed:.2f}s, "
+          f"extend_utc_calls {extend_elapsed:.2f}s")
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,55 @@
+"""Benchmark of the weekday aggregation
+
+Run with `python -m benchmarks.bench_weekday [n_calls]`.
+"""
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from backend import create, extract
+from benchmarks.synthetic import make_messages
+
+
+def weekday_totals_iterrows(df):
+    """row by row aggregation weekday_plot used to do"""
+    week = pd.DataFrame({'Day': create.WEEKDAYS, 'Duration': np.zeros(7)},
+                        columns=['Day', 'Duration']).set_index("Day")
+    for _, row in df.iterrows():
+        try:
+            day = int(row["Start Time"].weekday())
+        except ValueError:
+            continue
+        value = row["Duration"]
+        week.iloc[day].loc['Duration'] += value if value == value else 0
+    return week['Duration'].to_numpy()
+
+
+def main(n_calls=100000):
+    df = extract.extract_calls(lambda progress: None, make_messages(n_calls),
+                               'Europe/Berlin')
+
+    start = time.perf_counter()
+    expected = weekday_totals_iterrows(df)
+    iterrows = time.perf_counter() - start
+
+    start = time.perf_counter()
+    summary = create.summarize(df)
+    aggregated = time.perf_counter() - start
+
+    # the first figure pays for loading plotly's validators
+    create.weekday_plot(summary)
+    start = time.perf_counter()
+    create.weekday_plot(summary)
+    plotted = time.perf_counter() - start
+
+    assert np.allclose(summary['weekday'], expected)
+    print(f"{len(df)} rows: iterrows {iterrows:.2f}s, "
+          f"summarize {aggregated * 1000:.1f}ms "
+          f"({iterrows / aggregated:.0f}x faster), "
+          f"weekday_plot {plotted * 1000:.1f}ms")
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
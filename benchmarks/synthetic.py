@@ -0,0 +1,66 @@
+"""Synthetic skype exports for the benchmarks"""
+import datetime
+import random
+
+START_CONTENT = ('<partlist type="started" alt="" callId="{call_id}">'
+                 '<part identity="me"><name>me</name></part>'
+                 '<part identity="friend"><name>friend</name></part></partlist>')
+END_CONTENT = ('<partlist type="ended" alt="" callId="{call_id}">'
+               '<part identity="me"><name>me</name><duration>{duration}</duration></part>'
+               '<part identity="friend"><name>friend</name><duration>{duration}</duration></part>'
+               '</partlist>')
+
+
+def make_messages(n_calls, seed=0, legacy_share=0.1, unanswered_share=0.0):
+    """ builds a MessageList with n_calls calls, newest message first
+
+    Arguments:
+        n_calls {int} -- number of calls (two call events each)
+        seed {int} -- seed of the random generator
+        legacy_share {float} -- share of end directives referencing the
+                                message id of the start directive
+        unanswered_share {float} -- share of calls without end directive
+
+    Returns:
+        list -- skype structure ['conversations'][partner_index]['MessageList']
+    """
+    rnd = random.Random(seed)
+    time = datetime.datetime(2015, 1, 1, tzinfo=datetime.timezone.utc)
+    message_id = 1420070400000
+    users = ['8:me', '8:friend']
+    messages = []
+    for i in range(n_calls):
+        time += datetime.timedelta(seconds=rnd.randint(600, 100000))
+        duration = rnd.randint(10, 20000)
+        message_id += rnd.randint(1000, 100000)
+        call_id = f'{i:08x}-aaaa-bbbb-cccc-{i:012x}'
+        end_id = str(message_id) if rnd.random() < legacy_share else call_id
+        end = time + datetime.timedelta(seconds=duration)
+        unanswered = (unanswered_share and
+                      rnd.random() < unanswered_share)
+        messages.append({
+            'id': str(message_id),
+            'originalarrivaltime': time.strftime('%Y-%m-%dT%H:%M:%S.123Z'),
+            'messagetype': 'Event/Call',
+            'from': rnd.choice(users),
+            'content': START_CONTENT.format(call_id=call_id),
+        })
+        messages.append({
+            'id': str(message_id + 1),
+            'originalarrivaltime': time.strftime('%Y-%m-%dT%H:%M:%S.456Z'),
+            'messagetype': 'RichText',
+            'from': rnd.choice(users),
+            'content': 'hello',
+        })
+        if unanswered:
+            continue
+        messages.append({
+            'id': str(message_id + 2),
+            'originalarrivaltime': end.strftime('%Y-%m-%dT%H:%M:%S.789Z'),
+            'messagetype': 'Event/Call',
+            'from': rnd.choice(users),
+            'content': END_CONTENT.format(call_id=end_id,
+                                          duration=f'{duration}.5'),
+        })
+    messages.reverse()
+    return messages
@@ -13,9 +13,5 @@ download_content=[
                                     style={'color': '#f8f8ff'})],
                     className='button', 
                     n_clicks=0)),
-            dcc.Download(id="download-duration-plot"),
-            dcc.Download(id="download-weekday-plot"),
-            dcc.Download(id="download-calendar-plot"),
-            dcc.Download(id="download-caller-plot"),
-            dcc.Download(id="download-terminator-plot"),
+            dcc.Download(id="download-plots"),
         ]
\ No newline at end of file
@@ -0,0 +1,25 @@
+import dash_bootstrap_components as dbc
+from dash import dcc
+
+# the figure of the active tab is fetched by assets/figures.js
+plot_tabs = {
+    'duration-plot': 'Duration',
+    'weekday-plot': 'Weekday',
+    'calendar-plot': 'Calendar',
+    'caller-plot': 'Call starter',
+    'terminator-plot': 'Call ender',
+}
+
+results_content = [
+    dcc.Store(id='plot-ids', data=list(plot_tabs)),
+    dbc.Tabs(id='plot-tabs',
+             active_tab='duration-plot',
+             children=[dbc.Tab(label=label, tab_id=plot_id)
+                       for plot_id, label in plot_tabs.items()]),
+    dbc.Card(
+        dbc.CardBody([
+            dcc.Graph(id='plot-graph'),
+        ]),
+        className="multi-tab",
+    ),
+]
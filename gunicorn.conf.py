@@ -0,0 +1,14 @@
+"""Settings of `gunicorn app:server`, read from the working directory"""
+import os
+
+
+def when_ready(server):
+    # with --preload the master imports the backend once and the forked
+    # workers share its pages copy-on-write instead of importing it again
+    if server.cfg.preload_app:
+        import app
+        app.preload()
+    if 'REDIS_URL' not in os.environ:
+        # the background callbacks run in processes forked by the workers
+        from backend import renderer
+        renderer.start_server()
@@ -0,0 +1,91 @@
+import multiprocessing
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import orjson
+import pandas as pd
+
+from backend import batch, create, extract, store
+from backend.progress import ProgressReporter
+from test_stream import save_test_export
+
+
+def extract_in_pool_worker(key):
+    # pool workers are daemonic like the workers of a Celery pool
+    return len(batch.extract_everyone(lambda progress: None, key,
+                                      max_workers=2))
+
+
+class TestBatch(unittest.TestCase):
+
+    def setUp(self):
+        self.export_dir = tempfile.mkdtemp()
+        self.patcher = mock.patch.object(store, 'EXPORT_DIR', self.export_dir)
+        self.patcher.start()
+
+    def tearDown(self):
+        self.patcher.stop()
+        shutil.rmtree(self.export_dir)
+
+    def test_extract_everyone(self):
+        with open("./tests/test_data/TestData.json", "rb") as f:
+            data = f.read()
+        key = save_test_export(data)
+        expected = []
+        conversations = orjson.loads(data)['conversations']
+        partners = [participant['username'] for participant
+                    in store.extract_conversations(conversations)]
+        for conversation in conversations:
+            if conversation['id'] not in partners:
+                continue
+            messages = conversation['MessageList']
+            calls = extract.extract_utc_calls(lambda progress: None, messages)
+            calls['Partner'] = conversation['id']
+            expected.append(calls)
+        expected = pd.concat(expected).sort_values(['Partner', 'Start Time'])
+
+        for max_workers in [1, 2]:
+            result = batch.extract_everyone(lambda progress: None, key,
+                                            max_workers=max_workers)
+
+            pd.testing.assert_frame_equal(result, expected)
+
+    def test_extract_in_daemonic_process(self):
+        with open("./tests/test_data/TestData.json", "rb") as f:
+            key = save_test_export(f.read())
+        expected = len(batch.extract_everyone(lambda progress: None, key,
+                                              max_workers=2))
+
+        with multiprocessing.get_context('fork').Pool(1) as pool:
+            self.assertEqual(pool.apply(extract_in_pool_worker, (key,)),
+                             expected)
+
+    def test_everyone_is_stored(self):
+        import app
+        with open("./tests/test_data/TestData.json", "rb") as f:
+            key = save_test_export(f.read())
+        everyone = {'label': 'Everyone', 'username': store.EVERYONE}
+        progress = ProgressReporter(lambda *args: None)
+
+        calls = app.get_df(progress, key, None, None, everyone, 'UTC')
+        with mock.patch.object(batch, 'extract_everyone',
+                               side_effect=AssertionError):
+            stored = app.get_df(progress, key, None, None, everyone, 'UTC')
+        plots = app.make_plots(create.summarize(stored), everyone)
+
+        self.assertEqual(len(store.load_calls(key, store.EVERYONE)[0]
+                             .to_frame()),
+                         len(batch.extract_everyone(lambda progress: None,
+                                                    key, max_workers=1)))
+        pd.testing.assert_frame_equal(stored, calls)
+        # the partner of every call is stored for the combined dashboard
+        self.assertEqual(set(stored['Partner']), set(batch.extract_everyone(
+            lambda progress: None, key, max_workers=1)['Partner']))
+        # without the annotation of a single friend
+        self.assertEqual(len(plots['caller-plot'].layout.annotations), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,129 @@
+import io
+import os
+import shutil
+import tarfile
+import tempfile
+import unittest
+from unittest import mock
+
+import diskcache
+import orjson
+
+from backend import cache, shared, store, utils
+
+TEST_DATA = os.path.join(os.path.dirname(__file__), 'test_data')
+
+
+class TestCache(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.patchers = [
+            mock.patch.object(store, 'EXPORT_DIR',
+                              os.path.join(self.cache_dir, 'exports')),
+            mock.patch.object(cache, 'RESULT_CACHE_DIR',
+                              os.path.join(self.cache_dir, 'results')),
+            mock.patch.object(cache, 'COUNTER_DIR',
+                              os.path.join(self.cache_dir, 'counters')),
+            mock.patch.object(cache, '_results', None),
+            mock.patch.object(cache, '_counters', None),
+        ]
+        for patcher in self.patchers:
+            patcher.start()
+
+    def tearDown(self):
+        cache.results().close()
+        cache.counters().close()
+        for patcher in self.patchers:
+            patcher.stop()
+        shutil.rmtree(self.cache_dir)
+
+    def test_results_are_computed_once(self):
+        computed = []
+
+        def compute():
+            computed.append(1)
+            return len(computed)
+
+        for _ in range(3):
+            result = cache.get_or_compute('calls', 'abc', '8:Mom', 'UTC',
+                                          compute)
+        other = cache.get_or_compute('calls', 'abc', '8:Mom', 'Asia/Tokyo',
+                                     compute)
+
+        self.assertEqual((result, other), (1, 2))
+        stats = cache.stats()
+        self.assertEqual((stats['result_hits'], stats['result_misses']), (2, 2))
+
+    def test_exports_are_evicted(self):
+        with mock.patch.object(cache, 'EXPORT_CACHE_SIZE', 1000):
+            first = utils.save_upload(
+                io.BytesIO(b'{"conversations": []}' + b' ' * 600), 'a.json')
+            second = utils.save_upload(
+                io.BytesIO(b'{"conversations": []}' + b' ' * 700), 'b.json')
+            self.assertEqual(utils.save_upload(
+                io.BytesIO(b'{"conversations": []}' + b' ' * 700), 'b.json'),
+                second)
+
+        self.assertFalse(store.has_export(first))
+        self.assertTrue(store.has_export(second))
+        stats = cache.stats()
+        self.assertEqual((stats['export_hits'], stats['export_misses']), (1, 2))
+        self.assertLessEqual(stats['export_bytes'], 1000)
+
+    def test_upload_is_stored(self):
+        with tarfile.open(os.path.join(TEST_DATA, 'TestData.tar')) as tar:
+            messages = tar.extractfile('messages.json').read()
+        with open(os.path.join(TEST_DATA, 'TestData.tar'), 'rb') as f:
+            tar_key = utils.save_upload(f, 'TestData.tar')
+        json_key = utils.save_upload(io.BytesIO(messages), 'messages.json')
+
+        self.assertEqual(tar_key, store.export_key(messages))
+        self.assertEqual(json_key, tar_key)
+        self.assertEqual(cache.stats()['export_hits'], 1)
+        with open(store.export_path(tar_key), 'rb') as f:
+            self.assertEqual(f.read(), messages)
+        self.assertEqual(len(store.load_index(tar_key)),
+                         len(orjson.loads(messages)['conversations']))
+        # only the stored export is left behind
+        self.assertEqual(os.listdir(store.EXPORT_DIR), [tar_key])
+
+    def test_upload_errors(self):
+        with self.assertRaises(ValueError):
+            utils.save_upload(io.BytesIO(b'{}'), 'messages.txt')
+        with self.assertRaises(ValueError):
+            utils.save_upload(io.BytesIO(b'not a tar'), 'export.tar')
+        with mock.patch.object(utils, 'MAX_UPLOAD_SIZE', 10), \
+                self.assertRaises(ValueError):
+            utils.save_upload(io.BytesIO(b' ' * 20), 'messages.json')
+        self.assertEqual(os.listdir(store.EXPORT_DIR), [])
+
+    def test_export_is_fetched_on_another_machine(self):
+        shared_cache = diskcache.Cache(os.path.join(self.cache_dir, 'shared'))
+        with open(os.path.join(TEST_DATA, 'TestData.json'), 'rb') as f:
+            data = f.read()
+        with mock.patch.object(shared, 'remote', return_value=True), \
+                mock.patch.object(shared, '_backend',
+                                  shared._DiskBackend(shared_cache)), \
+                mock.patch.object(shared, 'CHUNK_SIZE', 1000):
+            key = utils.save_upload(io.BytesIO(data), 'messages.json')
+            # the worker does not see the disk of the web process
+            shutil.rmtree(store.EXPORT_DIR)
+
+            self.assertTrue(cache.fetch_export(key))
+            self.assertGreater(len(shared_cache), len(data) // 1000)
+            with open(store.export_path(key), 'rb') as f:
+                self.assertEqual(f.read(), data)
+            self.assertEqual(os.listdir(store.EXPORT_DIR), [key])
+
+            # an evicted chunk is a missing export, not a truncated one
+            shutil.rmtree(store.EXPORT_DIR)
+            shared_cache.delete(f"export:{key}:3")
+            self.assertFalse(cache.fetch_export(key))
+            self.assertFalse(cache.fetch_export('../' + key))
+            self.assertEqual(os.listdir(store.EXPORT_DIR), [])
+        shared_cache.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
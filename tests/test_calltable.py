@@ -0,0 +1,49 @@
+import unittest
+
+import numpy as np
+import orjson
+import pandas as pd
+
+from backend import extract
+from backend.calltable import CallTable, memory_report
+
+
+def read_test_calls():
+    with open("./tests/test_data/TestData.json", "rb") as f:
+        conversations = orjson.loads(f.read())['conversations']
+    return extract.extract_utc_calls(lambda progress: None,
+                                     conversations[0]['MessageList'])
+
+
+class TestCallTable(unittest.TestCase):
+
+    def test_round_trip(self):
+        df = read_test_calls()
+        df.loc[df.index[0], ['Start Time', 'Caller', 'Weekday']] = np.nan
+
+        table = CallTable.from_frame(df)
+
+        self.assertEqual(table.columns['start'].dtype, np.int64)
+        self.assertEqual(table.columns['duration'].dtype, np.float32)
+        self.assertEqual(table.columns['weekday'].dtype, np.int8)
+        self.assertEqual(table.columns['caller'][0], -1)
+        pd.testing.assert_frame_equal(table.to_frame(), df)
+
+    def test_round_trip_with_partners(self):
+        df = read_test_calls()
+        df['Partner'] = ['8:A', '8:B'] * 3 + ['8:A']
+
+        table = CallTable.from_frame(df)
+
+        self.assertEqual(table.columns['partner'].dtype, np.int16)
+        pd.testing.assert_frame_equal(table.to_frame(), df)
+
+    def test_memory_report(self):
+        report = memory_report(read_test_calls())
+
+        self.assertEqual(report['rows'], 7)
+        self.assertLess(report['table_bytes'], report['frame_bytes'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+import unittest
+
+import numpy as np
+import orjson
+
+from backend import create, extract
+
+
+def read_test_calls(timezone):
+    with open("./tests/test_data/TestData.json", "rb") as f:
+        conversations = orjson.loads(f.read())['conversations']
+    return extract.get_calls(lambda progress: None, conversations, 0,
+                             timezone)
+
+
+class TestCreate(unittest.TestCase):
+
+    def test_summarize(self):
+        df = read_test_calls("Europe/Berlin")
+
+        summary = create.summarize(df)
+
+        self.assertEqual(summary['first_day'], '2022-05-03')
+        self.assertEqual(len(summary['daily']), 7)
+        self.assertAlmostEqual(summary['daily'].sum(), df['Duration'].sum())
+        self.assertAlmostEqual(summary['weekday'].sum(), df['Duration'].sum())
+        self.assertEqual(sum(summary['callers'].values()),
+                         df['Caller'].count())
+        self.assertEqual(summary['calls'], 7)
+
+    def test_weekday_skips_missing_values(self):
+        df = read_test_calls("Europe/Berlin").iloc[:3].copy()
+        df['Weekday'] = [0.0, 0.0, float('nan')]
+        df['Duration'] = [60.0, float('nan'), 30.0]
+
+        summary = create.summarize(df)
+
+        self.assertEqual(list(summary['weekday']), [60.0] + [0.0] * 6)
+
+    def test_calendar_plot(self):
+        summary = {'first_day': '2021-12-31', 'daily': np.array([3600.0, 0, 7200])}
+
+        fig = create.calendar_plot(summary)
+
+        heatmaps = [trace for trace in fig.data if trace.type == 'heatmap']
+        self.assertEqual([trace.name for trace in heatmaps], ['2021', '2022'])
+        # 31 December 2021 is a Friday, 2 January 2022 a Sunday
+        self.assertEqual(heatmaps[0].z[4][-1], 1.0)
+        self.assertEqual(heatmaps[1].z[6][0], 2.0)
+        self.assertEqual(heatmaps[1].customdata[6][0], '2022-01-02')
+        self.assertTrue(np.isnan(heatmaps[1].z[0][0]))
+
+    def test_plots_take_summary(self):
+        summary = create.summarize(read_test_calls("Asia/Tokyo"))
+        participant = {'label': 'Bestie', 'username': '8:Bestie'}
+
+        create.duration_plot(summary)
+        create.weekday_plot(summary)
+        create.calendar_plot(summary)
+        create.caller_plot(summary, participant)
+        create.terminator_plot(summary, participant)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+import io
+import shutil
+import tempfile
+import time
+import unittest
+import zipfile
+from unittest import mock
+
+import numpy as np
+import orjson
+
+from backend import cache, create, export, renderer
+
+
+def make_figures():
+    summary = {
+        'first_day': '2022-05-03',
+        'daily': np.array([3600.0, 0.0, 1800.0]),
+        'weekday': [3600.0, 0.0, 0.0, 1800.0, 0.0, 0.0, 0.0],
+        'callers': {'8:A': 2},
+        'terminators': {'8:A': 1, '8:B': 1},
+        'calls': 2,
+        'duration': 5400.0,
+    }
+    participant = {'label': 'A', 'username': '8:A'}
+    return {
+        'duration-plot': create.duration_plot(summary),
+        'weekday-plot': create.weekday_plot(summary),
+        'calendar-plot': create.calendar_plot(summary),
+        'caller-plot': create.caller_plot(summary, participant),
+        'terminator-plot': create.terminator_plot(summary, participant),
+    }
+
+
+def make_plots():
+    # as they arrive from the plots dcc.Store
+    return {plot_id: orjson.loads(figure.to_json())
+            for plot_id, figure in make_figures().items()}
+
+
+def slow_png(key, figure):
+    # stores the image like the render server
+    time.sleep(0.05)
+    cache.results().set(key, b'png')
+    return b'png'
+
+
+class TestExport(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.patchers = [
+            mock.patch.object(cache, 'RESULT_CACHE_DIR', self.cache_dir),
+            mock.patch.object(cache, '_results', None),
+            mock.patch.object(export, '_to_png',
+                              side_effect=slow_png),
+        ]
+        for patcher in self.patchers:
+            patcher.start()
+
+    def tearDown(self):
+        cache.results().close()
+        for patcher in self.patchers:
+            patcher.stop()
+        shutil.rmtree(self.cache_dir)
+
+    def test_export_zip(self):
+        plots = make_plots()
+
+        data = export.export_zip(plots)
+        export.export_zip(plots)
+
+        with zipfile.ZipFile(io.BytesIO(data)) as zf:
+            self.assertEqual(sorted(zf.namelist()),
+                             sorted(export.IMAGE_NAMES.values()))
+        # the second download is served from the cache
+        self.assertEqual(export._to_png.call_count, 5)
+
+    def test_prerender_without_server(self):
+        with mock.patch.object(renderer, 'render',
+                               side_effect=ConnectionRefusedError) as render:
+            export.prerender(make_plots())
+
+        # left to the download
+        self.assertEqual(render.call_count, 1)
+        self.assertEqual(export._to_png.call_count, 0)
+
+    def test_figure_key(self):
+        plots = make_plots()
+        reordered = dict(reversed(list(plots['caller-plot'].items())))
+
+        self.assertEqual(export.figure_key(plots['caller-plot']),
+                         export.figure_key(reordered))
+        self.assertNotEqual(export.figure_key(plots['caller-plot']),
+                            export.figure_key(plots['terminator-plot']))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,7 +1,45 @@
 import unittest
+from unittest import mock
 import pandas as pd
+import orjson
 import os
 
+from backend import extract, store
+
+
+def read_test_conversations():
+    with open("./tests/test_data/TestData.json", "rb") as f:
+        return orjson.loads(f.read())['conversations']
+
+
+def with_legacy_ids(messages):
+    """end directives reference the message id of their start directive
+    like in exports from before 2019"""
+    start_ids = {}
+    for obj in messages:
+        if extract.is_call(obj) and 'type="started"' in obj['content']:
+            start_ids[extract.parse_call_content(obj['content'])[1]] = obj['id']
+    legacy = []
+    for obj in messages:
+        obj = dict(obj)
+        if extract.is_call(obj) and 'type="ended"' in obj['content']:
+            call_id = extract.parse_call_content(obj['content'])[1]
+            obj['content'] = obj['content'].replace(call_id, start_ids[call_id])
+        legacy.append(obj)
+    return legacy
+
+
+def fix_old_ids_iterrows(df):
+    """row by row reconciliation fix_old_ids used to do"""
+    for index, row in df.iterrows():
+        if len(index) <= 13:
+            df.loc[df['ID'] == index, 'End Time'] = df.loc[index, 'End Time']
+            df.loc[df['ID'] == index, 'Duration'] = df.loc[index, 'Duration']
+            df.loc[df['ID'] == index, 'Terminator'] = df.loc[index,
+                                                             'Terminator']
+            df.drop(index, inplace=True)
+    return df
+
 
 class TestExtraction(unittest.TestCase):
     """
@@ -9,23 +47,196 @@ class TestExtraction(unittest.TestCase):
         self.assertEqual(1, 1)
     """
     def test_conversations(self):
-        input = "./tests/test_data/mock.json"
+        conversations = read_test_conversations()
 
-        options, indexes = extraction.get_conversations.extract_conversations(
-            input, test=True)
+        participants = store.extract_conversations(conversations)
 
-        self.assertEqual(options, ['8:BBB'])
-        self.assertEqual(indexes, {'8:BBB': 0})
+        self.assertEqual(participants, [
+            {'label': 'Bestie', 'username': '8:Bestie'},
+            {'label': 'Mom', 'username': '8:Mom'},
+        ])
 
     def test_calls(self):
-        input = "./tests/test_data/mock.json"
+        conversations = read_test_conversations()
+
+        expected_result = pd.read_csv("./tests/test_data/TestData.csv")
 
-        expected_result = pd.read_csv("./tests/test_data/mock.csv")
-        
-        result_df = extraction.get_calls.get_calls(input, 0, "Europe/Berlin")
+        result_df = extract.get_calls(lambda progress: None, conversations, 0,
+                                      "Europe/Berlin")
         result_df.to_csv("./tests/test_data/temp.csv")
         result = pd.read_csv("./tests/test_data/temp.csv")
 
         self.assertTrue(result.equals(expected_result))
         os.remove("./tests/test_data/temp.csv")
 
+    def test_calls_pairs_first_directives(self):
+        messages = [
+            {'id': '3', 'originalarrivaltime': '2022-05-04T10:30:00.000Z',
+             'messagetype': 'Event/Call', 'from': '8:B',
+             'content': '<partlist type="ended" callId="abc-def-ghi-jkl"><part>'
+                        '<duration>1800.5</duration></part></partlist>'},
+            {'id': '2', 'originalarrivaltime': '2022-05-04T10:00:00.000Z',
+             'messagetype': 'RichText', 'from': '8:A', 'content': 'hi'},
+            {'id': '1', 'originalarrivaltime': '2022-05-04T10:00:00.000Z',
+             'messagetype': 'Event/Call', 'from': '8:A',
+             'content': '<partlist type="started" callId="abc-def-ghi-jkl">'
+                        '<part></part></partlist>'},
+        ]
+
+        result = extract.extract_calls(lambda progress: None, messages, "UTC")
+
+        self.assertEqual(len(result), 1)
+        call = result.loc['abc-def-ghi-jkl']
+        self.assertEqual(call['ID'], '3')
+        self.assertEqual(call['Caller'], '8:A')
+        self.assertEqual(call['Terminator'], '8:B')
+        self.assertEqual(call['Duration'], 1800.5)
+        self.assertEqual(call['Weekday'], 2)
+
+    def test_call_content_matches_lxml(self):
+        contents = [obj['content'] for conversation in read_test_conversations()
+                    for obj in conversation['MessageList']
+                    if extract.is_call(obj)]
+        contents += [
+            '<partlist type="ended" callId="x"><part identity="a"/>'
+            '<part><duration>5</duration></part></partlist>',
+            '<partlist type="ended" callId="x"><part><duration></duration>'
+            '<duration>7</duration></part></partlist>',
+            '<partlist type="ended" callId="x" alt="&amp;"><part>'
+            '<duration>3</duration></part></partlist>',
+            "<partlist type='ended' callId='x'><part><duration>3</duration>"
+            "</part></partlist>",
+            '<partlist alt=" type=" type="ended" callId="x"><part>'
+            '<duration>2</duration></part></partlist>',
+            '<partlist type="started" callId="a\nb\tc\rd"><part>'
+            '</part></partlist>',
+            '<partlist type="ended" callId="x"><part identity="a"><part>b'
+            '</part><duration>5</duration></part></partlist>',
+        ]
+
+        for content in contents:
+            self.assertEqual(extract.parse_call_content(content),
+                             extract._parse_call_content_xml(content))
+            self.assertEqual(extract.parse_call_id(content),
+                             extract._parse_call_content_xml(content)[1])
+
+    def test_fix_old_ids(self):
+        for conversation in read_test_conversations()[:2]:
+            for messages in [conversation['MessageList'],
+                             with_legacy_ids(conversation['MessageList'])]:
+                starts, ends = extract.collect_call_events(lambda progress: None,
+                                                           messages)
+                df = extract.join_calls(starts, ends, "Europe/Berlin")
+
+                result = extract.fix_old_ids(df.copy())
+
+                pd.testing.assert_frame_equal(result,
+                                              fix_old_ids_iterrows(df.copy()))
+
+    def test_midnight_split_over_several_days(self):
+        df = pd.DataFrame({
+            'Caller': ['8:A'],
+            'Duration': [266400.0],
+            'End Time': [pd.Timestamp('2022-03-29 12:00:00', tz='Europe/Berlin')],
+            'ID': ['1'],
+            'Start Time': [pd.Timestamp('2022-03-26 21:00:00', tz='Europe/Berlin')],
+            'Terminator': ['8:B'],
+            'Weekday': [5.0],
+        }, index=pd.Index(['abc-def-ghi-jkl'], name='Call ID'))
+
+        result = extract.assign_date_for_midnight(df, "Europe/Berlin")
+
+        self.assertEqual(len(result), 4)
+        self.assertEqual(list(result['Caller'].fillna('')),
+                         ['8:A', '', '', ''])
+        self.assertEqual(list(result['Terminator'].fillna('')),
+                         ['', '', '', '8:B'])
+        # 27 March 2022 has 23 hours in Berlin
+        self.assertEqual(list(result['Duration']),
+                         [10799.0, 82799.0, 86399.0, 43200.0])
+        self.assertEqual(list(result['Weekday']), [5.0, 6.0, 0.0, 1.0])
+        self.assertEqual(result['Start Time'].iloc[1],
+                         pd.Timestamp('2022-03-27 00:00:00', tz='Europe/Berlin'))
+
+    def test_project_calls(self):
+        messages = read_test_conversations()[0]['MessageList']
+        calls = extract.extract_utc_calls(lambda progress: None, messages)
+        utc_calls = calls.copy()
+
+        for timezone in ["Asia/Tokyo", "Europe/Berlin", "America/New_York"]:
+            pd.testing.assert_frame_equal(
+                extract.project_calls(calls, timezone),
+                extract.extract_calls(lambda progress: None, messages,
+                                      timezone))
+        pd.testing.assert_frame_equal(calls, utc_calls)
+
+    def test_project_calls_splits_at_local_midnight(self):
+        calls = pd.DataFrame({
+            'Caller': ['8:A'],
+            'Duration': [7200.0],
+            'End Time': [pd.Timestamp('2022-05-04 23:30:00', tz='UTC')],
+            'ID': ['1'],
+            'Start Time': [pd.Timestamp('2022-05-04 21:30:00', tz='UTC')],
+            'Terminator': ['8:B'],
+            'Weekday': [2.0],
+        }, index=pd.Index(['abc-def-ghi-jkl'], name='Call ID'))
+
+        self.assertEqual(len(extract.project_calls(calls, "UTC")), 1)
+        berlin = extract.project_calls(calls, "Europe/Berlin")
+        self.assertEqual(list(berlin['Duration']), [1799.0, 5400.0])
+        self.assertEqual(list(berlin['Weekday']), [2.0, 3.0])
+
+    def test_extend_utc_calls(self):
+        conversations = read_test_conversations()
+        # the earlier exports end during a call
+        for conversation, cut in [(conversations[0], '2022-05-07T16:00:00'),
+                                  (conversations[0], '2022-05-08T19:00:00'),
+                                  (conversations[1], '2022-06-05T16:00:00')]:
+            messages = conversation['MessageList']
+            earlier = [obj for obj in messages
+                       if obj['originalarrivaltime'] <= cut]
+            calls = extract.extract_utc_calls(lambda progress: None, earlier)
+
+            result = extract.extend_utc_calls(lambda progress: None, messages,
+                                              calls,
+                                              extract.get_watermark(earlier))
+
+            pd.testing.assert_frame_equal(
+                result, extract.extract_utc_calls(lambda progress: None,
+                                                  messages))
+
+    def test_extend_utc_calls_with_unanswered_call(self):
+        messages = read_test_conversations()[0]['MessageList']
+        # the oldest call is never answered
+        oldest_end = min((obj for obj in messages if extract.is_call(obj) and
+                          extract.parse_call_content(obj['content'])[0]
+                          == 'ended'),
+                         key=lambda obj: obj['originalarrivaltime'])
+        messages = [obj for obj in messages if obj is not oldest_end]
+        earlier = [obj for obj in messages
+                   if obj['originalarrivaltime'] <= '2022-05-08T21:00:00']
+        calls = extract.extract_utc_calls(lambda progress: None, earlier)
+        self.assertTrue(calls['End Time'].isna().any())
+
+        with mock.patch.object(extract, 'parse_call_id',
+                               wraps=extract.parse_call_id) as parse_call_id:
+            result = extract.extend_utc_calls(lambda progress: None, messages,
+                                              calls,
+                                              extract.get_watermark(earlier))
+
+        pd.testing.assert_frame_equal(
+            result, extract.extract_utc_calls(lambda progress: None, messages))
+        # the earlier messages are not scanned for the unanswered call
+        self.assertEqual(parse_call_id.call_count, 0)
+
+    def test_extend_utc_calls_needs_superset(self):
+        messages = read_test_conversations()[0]['MessageList']
+        calls = extract.extract_utc_calls(lambda progress: None, messages)
+        watermark = extract.get_watermark(messages)
+
+        result = extract.extend_utc_calls(
+            lambda progress: None,
+            [obj for obj in messages if obj['id'] != watermark[1]],
+            calls, watermark)
+
+        self.assertIsNone(result)
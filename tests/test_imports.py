@@ -0,0 +1,53 @@
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LAZY_MODULES = ['pandas', 'numpy', 'lxml', 'plotly.graph_objects',
+                'kaleido', 'backend.create', 'backend.export',
+                'backend.extract']
+
+
+class TestImports(unittest.TestCase):
+
+    def test_app_imports_backend_lazily(self):
+        result = subprocess.run(
+            [sys.executable, '-c',
+             'import sys, app; print(" ".join(sys.modules))'],
+            capture_output=True, text=True, check=True, cwd=ROOT)
+        imported = set(result.stdout.split())
+
+        self.assertEqual([module for module in LAZY_MODULES
+                          if module in imported], [])
+
+    def test_upload_imports_backend_lazily(self):
+        # the busiest path of the web workers
+        with tempfile.TemporaryDirectory() as export_dir:
+            result = subprocess.run(
+                [sys.executable, '-c',
+                 'import sys, app\n'
+                 'from backend import utils\n'
+                 'with open("tests/test_data/TestData.json", "rb") as f:\n'
+                 '    key = utils.save_upload(f, "messages.json")\n'
+                 'app.on_upload({"token": key})\n'
+                 'print(" ".join(sys.modules))'],
+                capture_output=True, text=True, check=True, cwd=ROOT,
+                env={**os.environ, 'EXPORT_CACHE_DIR': export_dir})
+        imported = set(result.stdout.split())
+
+        self.assertEqual([module for module in LAZY_MODULES
+                          if module in imported], [])
+
+    def test_preload(self):
+        result = subprocess.run(
+            [sys.executable, '-c',
+             'import sys, app; app.preload(); print(" ".join(sys.modules))'],
+            capture_output=True, text=True, check=True, cwd=ROOT)
+
+        self.assertIn('backend.create', result.stdout.split())
+
+
+if __name__ == '__main__':
+    unittest.main()
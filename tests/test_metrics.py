@@ -0,0 +1,88 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from backend import cache, metrics, store
+
+CALLBACK_BYTE_BUDGET = 64 * 2**10
+TEST_DATA = os.path.join(os.path.dirname(__file__), 'test_data')
+
+
+class TestMetrics(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.patchers = [
+            mock.patch.object(store, 'EXPORT_DIR',
+                              os.path.join(self.cache_dir, 'exports')),
+            mock.patch.object(cache, 'COUNTER_DIR',
+                              os.path.join(self.cache_dir, 'counters')),
+            mock.patch.object(cache, '_counters', None),
+            mock.patch.object(metrics, 'CALLBACK_BYTE_BUDGET',
+                              CALLBACK_BYTE_BUDGET),
+        ]
+        for patcher in self.patchers:
+            patcher.start()
+
+    def tearDown(self):
+        cache.counters().close()
+        for patcher in self.patchers:
+            patcher.stop()
+        shutil.rmtree(self.cache_dir)
+
+    def test_totals(self):
+        metrics.record('plots.data', 100, 2000, 0.5)
+        entry = metrics.record('plots.data', 300, 1000, 0.25)
+
+        self.assertEqual(entry['duration_ms'], 250)
+        totals = metrics.stats()['plots.data']
+        self.assertEqual((totals['calls'], totals['request_bytes'],
+                          totals['max_response_bytes'], totals['duration_ms']),
+                         (2, 400, 2000, 750))
+
+    def test_budget(self):
+        entry = metrics.record('plots.data', 100, 2000, 0.5)
+        self.assertTrue(metrics.check_budget(entry))
+        with self.assertLogs(metrics.logger, 'WARNING'):
+            self.assertFalse(metrics.check_budget(entry, budget=1000))
+        with self.assertRaises(metrics.BudgetExceeded):
+            metrics.check_budget(entry, budget=1000, strict=True)
+
+    def test_callbacks_keep_to_budget(self):
+        import app
+        client = app.server.test_client()
+        with mock.patch.dict(app.server.config, {'TESTING': True}):
+            with open(os.path.join(TEST_DATA, 'TestData.tar'), 'rb') as f:
+                token = client.post('/upload?filename=TestData.tar',
+                                    data=f.read()).json['token']
+            response = client.post('/_dash-update-component', json={
+                'output': '..participant_DD.options...participant_userid.data'
+                          '...export-key.data..',
+                'inputs': [{'id': 'upload-handle', 'property': 'data',
+                            'value': {'token': token}}],
+                'changedPropIds': ['upload-handle.data'],
+                'state': [],
+            })
+            self.assertEqual(response.status_code, 200)
+
+            # an upload in the callback state is caught
+            with self.assertRaises(metrics.BudgetExceeded):
+                client.post('/_dash-update-component', json={
+                    'output': '..participant_DD.options...participant_userid'
+                              '.data...export-key.data..',
+                    'inputs': [{'id': 'upload-handle', 'property': 'data',
+                                'value': {'token': token,
+                                          'contents': ' ' * 2**20}}],
+                    'changedPropIds': ['upload-handle.data'],
+                    'state': [],
+                })
+
+        totals = client.get('/callback-metrics').json
+        self.assertEqual(totals['..participant_DD.options...participant_userid'
+                                '.data...export-key.data..']['calls'], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
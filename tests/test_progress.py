@@ -0,0 +1,38 @@
+import unittest
+
+from backend.progress import ProgressReporter
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestProgress(unittest.TestCase):
+
+    def test_updates_are_rate_limited(self):
+        updates = []
+        clock = FakeClock()
+        progress = ProgressReporter(updates.append, updates_per_second=2,
+                                    clock=clock)
+
+        progress.stage('extract', 1000)
+        for i in range(1000):
+            clock.now = i / 1000
+            progress.advance(i)
+
+        self.assertEqual(updates[0], ('0', '1000', 'Extracting calls (0/1000)'))
+        self.assertEqual([update[0] for update in updates[1:]], ['500'])
+
+    def test_stages_are_always_reported(self):
+        updates = []
+        progress = ProgressReporter(updates.append, clock=FakeClock())
+
+        progress.stage('parse')
+        progress.stage('reconcile')
+
+        self.assertEqual([update[2] for update in updates],
+                         ['Reading messages (0/1)', 'Matching calls (0/1)'])
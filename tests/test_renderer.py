@@ -0,0 +1,183 @@
+import io
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+import zipfile
+from multiprocessing.connection import Listener
+from unittest import mock
+
+import diskcache
+import orjson
+
+from backend import cache, export, renderer
+from backend.renderer import RendererPool, RendererServer
+from test_export import make_plots
+
+
+class TestRendererPool(unittest.TestCase):
+    def setUp(self):
+        self.pool = RendererPool(processes=1, max_renders=2)
+        self.addCleanup(self.pool.shutdown)
+
+    def test_render(self):
+        # the third render runs in a replaced process
+        figure = orjson.dumps(make_plots()['duration-plot'])
+        for _ in range(3):
+            self.assertTrue(self.pool.render(figure, 1).startswith(b'\x89PNG'))
+
+    def test_restart_after_crash(self):
+        self.assertTrue(self.pool.check())
+        for process in self.pool._executor._processes.values():
+            process.kill()
+        figure = orjson.dumps(make_plots()['weekday-plot'])
+        self.assertTrue(self.pool.render(figure, 1).startswith(b'\x89PNG'))
+
+
+class BlockingPool:
+    """renders in order of arrival once released, like one renderer"""
+    processes = 1
+
+    def __init__(self):
+        self.released = threading.Event()
+        self.rendered = []
+
+    def render(self, figure_json, scale):
+        self.released.wait(10)
+        self.rendered.append(figure_json)
+        return b'png'
+
+    def check(self):
+        self.rendered.append(b'check')
+        return True
+
+
+class TestRendererQueue(unittest.TestCase):
+    def test_downloads_come_first(self):
+        pool = BlockingPool()
+        results = diskcache.Cache(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, results.directory)
+        self.addCleanup(results.close)
+        server = RendererServer(pool, results)
+        futures = [server.render(key, key.encode(), 1, renderer.PRERENDER)
+                   for key in 'abc']
+        # a is taken while the others wait
+        while not server._running:
+            time.sleep(0.01)
+        futures.append(server.render('d', b'd', 1))
+        futures.append(server.render('c', b'c', 1))
+        pool.released.set()
+
+        self.assertEqual([future.result(10) for future in futures],
+                         [b'png'] * 5)
+        self.assertEqual(pool.rendered, [b'a', b'd', b'c', b'b'])
+
+    def test_check_while_idle(self):
+        pool = BlockingPool()
+        results = diskcache.Cache(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, results.directory)
+        self.addCleanup(results.close)
+        server = RendererServer(pool, results)
+        future = server.render('a', b'a', 1)
+
+        self.assertTrue(server.check())
+        pool.released.set()
+        future.result(10)
+        while server._renders:
+            time.sleep(0.01)
+        self.assertTrue(server.check())
+
+        self.assertEqual(pool.rendered, [b'a', b'check'])
+
+
+class TestRendererServer(unittest.TestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.cache_dir)
+        address = os.path.join(self.cache_dir, 'renderer.sock')
+        patchers = [
+            mock.patch.dict(os.environ, {
+                'RENDERER_ADDRESS': address,
+                'RESULT_CACHE_DIR': os.path.join(self.cache_dir, 'results'),
+            }),
+            mock.patch.object(renderer, 'RENDERER_ADDRESS', address),
+            mock.patch.object(cache, 'RESULT_CACHE_DIR',
+                              os.path.join(self.cache_dir, 'results')),
+            mock.patch.object(cache, '_results', None),
+            # renders must not fall back to a pool in this process
+            mock.patch.object(renderer, 'pool', side_effect=AssertionError),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        os.environ.pop('RENDERER_AUTHKEY', None)
+
+    def tearDown(self):
+        cache.results().close()
+
+    def start_server(self):
+        os.environ['RENDERER_AUTHKEY'] = 'test'
+        pool = RendererPool(processes=1)
+        self.addCleanup(pool.shutdown)
+        server = RendererServer(pool, cache.results())
+        listener = Listener(renderer.RENDERER_ADDRESS, family='AF_UNIX',
+                            authkey=b'test')
+        self.addCleanup(listener.close)
+        threading.Thread(target=server.serve, args=(listener,),
+                         daemon=True).start()
+        return pool
+
+    def test_figure_is_rendered_once(self):
+        pool = self.start_server()
+        figure = orjson.dumps(make_plots()['caller-plot'])
+
+        with mock.patch.object(pool, 'render', wraps=pool.render) as render:
+            threads = [threading.Thread(
+                target=renderer.render, args=('png:1:caller', figure, 1))
+                for _ in range(3)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            png = renderer.render('png:1:caller', figure, 1)
+
+        self.assertEqual(render.call_count, 1)
+        self.assertTrue(png.startswith(b'\x89PNG'))
+        self.assertEqual(cache.results().get('png:1:caller'), png)
+
+    def test_download_waits_for_prerender(self):
+        pool = self.start_server()
+        plots = make_plots()
+
+        with mock.patch.object(pool, 'render', wraps=pool.render) as render, \
+                mock.patch.object(export, 'SCALE', 1):
+            # answered before the images are rendered
+            export.prerender(plots)
+            data = export.export_zip(plots)
+            export.prerender(plots)
+
+        self.assertEqual(render.call_count, 5)
+        with zipfile.ZipFile(io.BytesIO(data)) as zf:
+            self.assertTrue(all(zf.read(name).startswith(b'\x89PNG')
+                                for name in export.IMAGE_NAMES.values()))
+
+    def test_download_from_server_process(self):
+        process = renderer.start_server()
+        self.addCleanup(process.wait)
+        self.addCleanup(process.terminate)
+        # started once per machine
+        self.assertIsNone(renderer.start_server())
+
+        figure = make_plots()['duration-plot']
+        png = export.render_png(figure)
+
+        self.assertTrue(png.startswith(b'\x89PNG'))
+        # stored by the server process
+        self.assertEqual(cache.results().get(
+            f"png:{export.SCALE}:{export.figure_key(figure)}"), png)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import diskcache
+
+from backend import session, shared
+from test_export import make_plots
+
+
+class TestSession(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.shared_cache = diskcache.Cache(self.cache_dir)
+        # sessions are created by a worker and read by the web processes
+        self.patchers = [
+            mock.patch.object(shared, 'remote', return_value=True),
+            mock.patch.object(shared, '_backend',
+                              shared._DiskBackend(self.shared_cache)),
+        ]
+        for patcher in self.patchers:
+            patcher.start()
+
+    def tearDown(self):
+        self.shared_cache.close()
+        for patcher in self.patchers:
+            patcher.stop()
+        shutil.rmtree(self.cache_dir)
+
+    def test_figures(self):
+        plots = make_plots()
+        key = session.create(plots)
+
+        self.assertLess(len(key), 32)
+        self.assertEqual(session.plot_ids(key), list(plots))
+        self.assertEqual(session.load_figure(key, 'calendar-plot'),
+                         plots['calendar-plot'])
+        self.assertEqual(session.load_figures(key), plots)
+
+    def test_expired(self):
+        key = session.create(make_plots())
+        self.shared_cache.delete(f"figure:{key}:weekday-plot:0")
+
+        self.assertIsNone(session.load_figure(key, 'weekday-plot'))
+        self.assertIsNone(session.load_figures(key))
+        self.assertIsNone(session.load_figures('unknown'))
+        self.assertIsNone(session.load_figures(None))
+
+    def test_figure_route(self):
+        import app
+        client = app.server.test_client()
+        plots = make_plots()
+        key = session.create(plots)
+
+        response = client.get(f'/figure/{key}/calendar-plot')
+        self.assertEqual(response.json, plots['calendar-plot'])
+        self.assertIn('private', response.headers['Cache-Control'])
+        self.assertEqual(client.get('/figure/unknown/calendar-plot')
+                         .status_code, 404)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,140 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+import orjson
+import pandas as pd
+
+from backend import extract, store, stream
+from backend.calltable import CallTable
+
+
+def read_test_data():
+    with open("./tests/test_data/TestData.json", "rb") as f:
+        return f.read()
+
+
+def save_test_export(data):
+    """stores an export the way an upload is stored"""
+    path = store.temporary_path()
+    with open(path, 'wb') as f:
+        f.write(data)
+    return store.save_export_file(path, store.export_key(data))
+
+
+class TestStream(unittest.TestCase):
+
+    def test_headers(self):
+        data = read_test_data()
+        conversations = orjson.loads(data)['conversations']
+
+        headers = stream.read_conversation_headers(data)
+
+        self.assertEqual(len(headers), len(conversations))
+        for header, conversation in zip(headers, conversations):
+            self.assertNotIn('MessageList', header)
+            self.assertEqual(header['id'], conversation['id'])
+            self.assertEqual(header['displayName'],
+                             conversation['displayName'])
+
+    def test_message_list(self):
+        data = read_test_data()
+        conversations = orjson.loads(data)['conversations']
+
+        for i, conversation in enumerate(conversations):
+            self.assertEqual(stream.read_message_list(data, i),
+                             conversation['MessageList'])
+
+    def test_brackets_in_strings(self):
+        data = (b'{"userId": "a]}", "conversations": [{"id": "8:x", '
+                b'"displayName": "{[\\"", "MessageList": [{"content": "]]}"}]}, '
+                b'{"id": "8:y", "displayName": null}]}')
+
+        conversations = list(stream.iter_conversations(data))
+
+        self.assertEqual([header for header, _ in conversations],
+                         [{'id': '8:x', 'displayName': '{["'},
+                          {'id': '8:y', 'displayName': None}])
+        self.assertEqual(stream.read_message_list(data, 0),
+                         [{'content': ']]}'}])
+        self.assertIsNone(conversations[1][1])
+
+    def test_malformed(self):
+        with self.assertRaises(ValueError):
+            stream.read_conversation_headers(b'{"conversations": [{"id": "8:x"')
+
+
+class TestStore(unittest.TestCase):
+
+    def setUp(self):
+        self.export_dir = tempfile.mkdtemp()
+        self.patcher = mock.patch.object(store, 'EXPORT_DIR', self.export_dir)
+        self.patcher.start()
+
+    def tearDown(self):
+        self.patcher.stop()
+        shutil.rmtree(self.export_dir)
+
+    def test_index(self):
+        data = read_test_data()
+        conversations = orjson.loads(data)['conversations']
+
+        key = save_test_export(data)
+
+        self.assertTrue(os.path.exists(store.export_path(key, 'index.json')))
+        self.assertEqual([h['id'] for h in store.read_conversation_headers(key)],
+                         [c['id'] for c in conversations])
+        for i, conversation in enumerate(conversations):
+            self.assertEqual(store.read_message_list(key, i),
+                             conversation['MessageList'])
+
+    def test_missing_index_is_rebuilt(self):
+        data = read_test_data()
+        key = save_test_export(data)
+        os.remove(store.export_path(key, 'index.json'))
+
+        messages = store.read_message_list(key, 1)
+
+        self.assertEqual(messages,
+                         orjson.loads(data)['conversations'][1]['MessageList'])
+        self.assertTrue(os.path.exists(store.export_path(key, 'index.json')))
+
+    def test_keys_stay_in_store(self):
+        outside = os.path.join(self.export_dir, '..', 'victim')
+        for key in ['../victim', outside, 'A' * 64, None]:
+            self.assertFalse(store.has_export(key))
+            with self.assertRaises(ValueError):
+                store.read_conversation_headers(key)
+        key = save_test_export(read_test_data())
+        for partner_id in ['..', '.', '']:
+            with self.assertRaises(ValueError):
+                store.load_calls(key, partner_id)
+
+    def test_malformed_file_is_not_stored(self):
+        path = os.path.join(self.export_dir, 'upload.tmp')
+        with open(path, 'wb') as f:
+            f.write(b'{"conversations": [{"id": "8:x"')
+        key = store.export_key(b'{"conversations": [{"id": "8:x"')
+
+        with self.assertRaises(ValueError):
+            store.save_export_file(path, key)
+        self.assertFalse(store.has_export(key))
+
+    def test_calls(self):
+        data = read_test_data()
+        key = save_test_export(data)
+        messages = store.read_message_list(key, 0)
+        calls = extract.extract_utc_calls(lambda progress: None, messages)
+        watermark = extract.get_watermark(messages)
+
+        self.assertIsNone(store.load_calls(key, '8:Bestie'))
+        store.save_calls(key, '8:Bestie', CallTable.from_frame(calls),
+                         watermark)
+        table, stored_watermark = store.load_calls(key, '8:Bestie')
+
+        self.assertIsInstance(table.columns['start'], np.memmap)
+        self.assertEqual(stored_watermark, watermark)
+        pd.testing.assert_frame_equal(table.to_frame(), calls)